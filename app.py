@@ -1,6 +1,15 @@
+import secrets
+
 import streamlit as st
-import pandas as pd
-import random
+import streamlit.components.v1 as components
+import bots
+import game_records
+import game_store
+import metrics
+import quiz_store
+import station_search
+import sync_hub
+from engine import EVENT_DECK_DATA, QUIZ_MODES, Game, describe_action
 
 # ページ設定
 st.set_page_config(page_title="新幹線すごろく", layout="wide")
@@ -38,232 +47,426 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-# ==========================================
-# ボーナスルールの定義
-# ==========================================
-BONUS_RULES = [
-    {
-        "name": "🐮 北海道新幹線好き",
-        "stations": ["札幌", "新小樽", "倶知安", "長万部", "新八雲", "新函館北斗", "木古内", "奥津軽いまべつ", "新青森"],
-        "type": "any", "threshold": 5, "points": 5
-    },
-    {
-        "name": "👹 秋田新幹線好き",
-        "stations": ["秋田", "大曲", "角館", "田沢湖", "雫石", "盛岡"],
-        "type": "any", "threshold": 5, "points": 5
-    },
-    {
-        "name": "🍒 山形新幹線好き",
-        "stations": ["新庄", "大石田", "村山", "さくらんぼ東根", "天童", "山形", "かみのやま温泉", "赤湯", "高畠", "米沢", "福島"],
-        "type": "any", "threshold": 5, "points": 5
-    },
-    {
-        "name": "🚄 東北新幹線好き",
-        "stations": ["新青森", "七戸十和田", "八戸", "二戸", "いわて沼宮内", "盛岡", "新花巻", "北上", "水沢江刺", "一ノ関", "くりこま高原", "古川", "仙台", "白石蔵王", "福島", "郡山", "新白河", "那須塩原", "宇都宮", "小山"],
-        "type": "any", "threshold": 5, "points": 5
-    },
-    {
-        "name": "🌾 上越新幹線好き",
-        "stations": ["大宮", "高崎", "上毛高原", "越後湯沢", "浦佐", "長岡", "燕三条", "新潟"],
-        "type": "any", "threshold": 5, "points": 5
-    },
-    {
-        "name": "🦀 北陸新幹線好き",
-        "stations": ["安中榛名", "軽井沢", "佐久平", "上田", "長野", "飯山", "上越妙高", "糸魚川", "黒部宇奈月温泉", "富山", "新高岡", "金沢", "小松", "加賀温泉", "福井", "芦原温泉", "越前たけふ", "敦賀"],
-        "type": "any", "threshold": 5, "points": 5
-    },
-    {
-        "name": "🗻 東海道新幹線好き",
-        "stations": ["新大阪", "京都", "米原", "岐阜羽島", "名古屋", "三河安城", "豊橋", "浜松", "掛川", "静岡", "新富士", "三島", "熱海", "小田原", "新横浜", "品川", "東京"],
-        "type": "any", "threshold": 5, "points": 5
-    },
-    {
-        "name": "🍑 山陽新幹線好き",
-        "stations": ["新神戸", "西明石", "姫路", "相生", "岡山", "新倉敷", "福山", "新尾道", "三原", "東広島", "広島", "新岩国", "徳山", "新山口", "厚狭", "新下関", "小倉"],
-        "type": "any", "threshold": 5, "points": 5
-    },
-    {
-        "name": "🕊️ 西九州新幹線好き",
-        "stations": ["新鳥栖", "武雄温泉", "嬉野温泉", "新大村", "諫早", "長崎"],
-        "type": "any", "threshold": 5, "points": 5
-    },
-    {
-        "name": "🐻 九州新幹線好き",
-        "stations": ["博多", "新鳥栖", "久留米", "筑後船小屋", "新大牟田", "新玉名", "熊本", "新八代", "新水俣", "出水", "川内", "鹿児島中央"],
-        "type": "any", "threshold": 5, "points": 5
-    },
-    {
-        "name": "🍊 四国制覇",
-        "stations": ["松山", "高知", "高松", "徳島"],
-        "type": "all", "points": 3
-    },
-    {
-        "name": "♨️ 温泉制覇",
-        "stations": ["かみのやま温泉", "黒部宇奈月温泉", "加賀温泉", "芦原温泉", "嬉野温泉", "武雄温泉"],
-        "type": "all", "points": 7
-    },
-    {
-        "name": "⛰️ 「山」がつく駅制覇",
-        "stations": ["村山", "山形", "郡山", "小山", "飯山", "富山", "岡山", "福山", "徳山", "新山口", "松山"],
-        "type": "all", "points": 10
-    },
-    {
-        "name": "🏙️ 大都市制覇",
-        "stations": ["東京", "新大阪", "名古屋"],
-        "type": "all", "points": 3
-    },
-    {
-        "name": "🏁 スタートとゴール",
-        "stations": ["札幌", "東京"],
-        "type": "all", "points": 5
-    }
-]
-
-EVENT_DECK_DATA = [
-    {"name": "追加乗車＋", "weight": 15, "desc": "今日はもう少し進もう！\n**サイコロを振って出た目の数だけ進む。**"},
-    {"name": "追加乗車ー", "weight": 15, "desc": "今日は少し戻ってみよう...\n**1〜3の好きな数だけ戻る。**"},
-    {"name": "お土産の誘惑", "weight": 15, "desc": "お土産を見てたら乗り遅れた！\n**【1回休み】になる。**"},
-    {"name": "旅の思い出",   "weight": 15, "desc": "窓から見える景色も思い出。\n**まだ誰も持っていないスタンプを1つゲットできる！**"},
-    {"name": "思い出の共有", "weight": 15, "desc": "他の人の思い出を聞こう。\n**他の人を一人選んで、スタンプを1つもらう。**"},
-    {"name": "博識（はくしき）", "weight": 10, "desc": "日本のことなら何でも知ってるぞ！\n**クイズの正解・不正解に関わらず、スタンプをゲット！**"},
-    {"name": "新幹線乗り換え", "weight": 10, "desc": "速い新幹線に乗り換えだ！\n**もう一度サイコロを振って、出た目 × 2マス進む。**"},
-    {"name": "幻のスタンプ帳", "weight": 5,  "desc": "すごいアイテムだ！\n**このターンに通ったマスのスタンプを全部ゲットできる！**"}
-]
-
 # ==========================================
 # 関数
 # ==========================================
-@st.cache_data
+@metrics.instrument("load_data")
 def load_data():
+    # 全セッションで共有する読み込み済みデータ（CSVが更新されたら自動で読み直す）
     try:
-        return pd.read_csv("quiz_data.csv")
+        return quiz_store.load()
     except FileNotFoundError:
         return None
 
-def calculate_score(player_name, stamp_owners):
-    my_stamps = [s for s, owner in stamp_owners.items() if owner == player_name]
+def current_game():
+    # フラグメントだけが再実行されたときも、ストアから今のゲームを取り直す
+    return store.load(st.session_state.room)
+
+def act(*action, report=st.error):
+    # 状態を変える操作はすべてここから（操作ログに1行追記される）。
+    # 古い画面のボタンなど、ルール上できない操作は report でエラーを出して None を返す
+    metrics.count("actions", st.session_state.metrics_session)
+    try:
+        return store.act(st.session_state.room, current_game(), action)
+    except (ValueError, IndexError) as e:
+        report(f"その操作はできませんでした（{e}）。画面を更新してね")
+        return None
+
+def report_later(message):
+    # on_click の中では画面に出せないので、次の描画でパネルに出す
+    st.session_state.action_error = message
+
+def show_action_error():
+    action_error = st.session_state.pop("action_error", None)
+    if action_error:
+        st.error(action_error)
+
+def use_card(player, slot, card_id, name):
+    # 「このカードを使う」の on_click 用。メッセージは次の描画でパネルに出す
+    event = act("use", player, slot, card_id, report=report_later)
+    if event is None:
+        return
+    effect = event[4:]
+    message = f"「{name}」を使った！"
+    if name in ("新幹線乗り換え", "追加乗車＋"):
+        message += f" 🎲 {effect[0]} → {effect[1]}マス進めるよ。下で進む先を選んでね"
+    elif name == "幻のスタンプ帳":
+        message += f" {'、'.join(effect)} のスタンプをゲット！" if effect else " ゲットできるスタンプはなかった..."
+        # スタンプが増えたらほかのパネルも変わる（on_click の中では st.rerun() できないので、パネルで描き直す）
+        st.session_state.rerun_app = bool(effect)
+    st.session_state.card_message = message
+
+def record_answer(player, key, correct):
+    # 「正解した / 不正解だった」の on_click 用（問題ごとの正答率に足される）
+    act("answer", player, key, correct, report=report_later)
+
+def travel_picker(game, key):
+    # 路線図で進む先を選ぶ（サイコロやカードで進むマスが残っているときだけ出る）
+    player = game.current_player
+    choices = game.destinations(player)
+    if not choices:
+        return
+    st.write(f"##### ▼ {game.positions[player]} から {game.pending_steps} マス進む")
+    destination = st.selectbox("進む先", list(choices), key=f"{key}_dest",
+                               format_func=lambda s: f"{s}（{' → '.join(choices[s])}）")
+    if st.button("ここへ進む！", key=f"{key}_go"):
+        if act("travel", player, destination) is not None:
+            st.toast(f"🚄 {player} が {destination} に着いた！")
+            st.rerun()
+
+def pick_station(label, stations, key):
+    # よみがな・ローマ字でも絞り込める駅の選択欄（見つからなければ None）
+    query = st.text_input(f"{label}を検索", key=f"{key}_search", placeholder="例: とうきょう / tokyo")
+    options = search_index.search(query, stations) if query else stations
+    if not options:
+        st.caption("見つかりません")
+        return None
+    return st.selectbox(label, options, format_func=search_index.label, key=key)
+
+def live_view(height=360):
+    # ほかの端末の操作もすぐ反映されるライブ中継（ハブからの差分でこの部分だけ書き換わる）
+    live.ensure(st.session_state.room, game)
+    components.html(sync_hub.viewer_html(st.session_state.room), height=height)
+
+def leave_room():
+    st.session_state.clear()
+    st.query_params.clear()
+
+quiz = load_data()
+search_index = station_search.get_index(quiz.stations) if quiz is not None else None
+store = game_store.get_store()
+# SUGOROKU_SYNC を指定したときだけ、状態の変化を同じルームを見ている端末へ中継する
+live = sync_hub.attach(store) if sync_hub.ENABLED else None
+# 終わったゲームは結果と操作ログをアーカイブに追記する（集計は game_analytics.py）
+if game_records.ARCHIVE_PATH:
+    game_records.attach(store)
+
+# ==========================================
+# 画面パーツ（フラグメント）
+# ==========================================
+# メイン画面のタブはそれぞれ独立して再実行されるフラグメントにする。
+# パネルの中のボタンやセレクトボックスを触ったときに再実行されるのはそのパネルだけで、
+# ほかのパネルの表示も変わる操作のときだけ st.rerun() で画面全体を描き直す
+#   サイコロ    → サイコロパネルだけ（game.dice_result）
+#   クイズ      → クイズパネルだけ（game.current_quiz_idx）
+#   カード      → アイテムパネルだけ（game.player_cards）
+#   スタンプ    → 画面全体（サイドバーの枚数・得点も変わる）
+#   交代・ゴール・取り消し → 画面全体
+@st.fragment
+@metrics.instrument("tab_dice")
+def dice_panel():
+    game = current_game()
+    current_player = game.current_player
+    st.header(f"{current_player} さん、サイコロを振ってね")
+    col1, col2 = st.columns([1, 2])
+    with col1:
+         if st.button("サイコロを振る！", key="dice_btn"):
+            act("roll")
+    with col2:
+        if game.dice_result is not None:
+            st.markdown(f"<div style='font-size:80px; font-weight:bold; color:#0066cc;'>🎲 {game.dice_result}</div>", unsafe_allow_html=True)
+            num = game.dice_result
+            if num >= 5:
+                st.success("たくさん進めるね！🚀")
+    st.caption(f"📍 {current_player} の現在地: {game.positions[current_player]}")
+    travel_picker(game, key="dice")
+
+@st.fragment
+@metrics.instrument("tab_quiz")
+def quiz_panel():
+    game = current_game()
+    st.header("駅のクイズ")
+    if quiz is not None:
+        st.write("##### ▼ 止まった駅のクイズ")
+        landed_station = pick_station("止まった駅", quiz.stations, key="quiz_station")
+        if st.button("この駅の問題を出題する！", key="station_quiz_btn") and landed_station:
+            event = act("station_quiz", landed_station, quiz.questions_of(landed_station), len(quiz))
+            if event is not None:
+                *_, reset, fallback = event
+                if fallback:
+                    st.info("この駅のまだ出ていない問題はないので、ランダムに出題したよ！")
+                if reset:
+                    st.toast("全問制覇おめでとう！問題がリセットされました♻️")
+
+        st.write("##### ▼ ランダムに出題")
+        st.write("ランダムに問題が出るよ！（同じ問題は出ないようになってるよ）")
+        mode = st.radio("出題のしかた", list(QUIZ_MODES), format_func=QUIZ_MODES.get, horizontal=True, key="quiz_mode")
+        if st.button("問題を出題する！", key="quiz_btn"):
+            if mode == "random":
+                event = act("quiz", len(quiz))
+                if event is not None and event[3]:
+                    st.toast("全問制覇おめでとう！問題がリセットされました♻️")
+            else:
+                metrics.count("actions", st.session_state.metrics_session)
+                store.pick_question(st.session_state.room, game, quiz, mode)
+        
+        if game.current_quiz_idx is not None and game.current_quiz_idx < len(quiz):
+            station_data = quiz[game.current_quiz_idx]
+            st.divider()
+            st.markdown(f"### 📍 {station_data.station}駅")
+            st.markdown(f"<div class='big-font'>{station_data.text}</div>", unsafe_allow_html=True)
+            st.write("") 
+            if station_data.choices:
+                for label, choice in zip("ABC", station_data.choices):
+                    st.markdown(f"**{label}.** {choice}")
+            st.write("---")
+            with st.expander("答えを見る"):
+                st.markdown(f"### 正解は... **{station_data.answer}**")
+                if station_data.explanation:
+                    st.info(f"💡 解説：{station_data.explanation}")
+                show_action_error()
+                if not game.quiz_answered:
+                    key = quiz_store.question_key(station_data)
+                    col_ok, col_ng = st.columns(2)
+                    col_ok.button("⭕ 正解した", key="answer_ok", on_click=record_answer,
+                                  args=(game.current_player, key, True))
+                    col_ng.button("❌ 不正解だった", key="answer_ng", on_click=record_answer,
+                                  args=(game.current_player, key, False))
+                else:
+                    correct, total = game.answers[game.current_player]
+                    st.caption(f"{game.current_player} の正答率: {correct}/{total}")
+
+@st.fragment
+@metrics.instrument("tab_cards")
+def card_panel():
+    if st.session_state.pop("rerun_app", False):
+        st.rerun()
+    game = current_game()
+    current_player = game.current_player
+    st.header(f"🎒 {current_player} のアイテム")
+    st.write("##### ▼ カードを引く")
+    
+    if st.button("イベントカードを引く！", key="draw_card"):
+        event = act("draw", current_player)
+        if event is not None:
+            st.success(f"「{EVENT_DECK_DATA[event[-1]]['name']}」を手に入れた！")
+    card_message = st.session_state.pop("card_message", None)
+    if card_message:
+        st.success(card_message)
+    show_action_error()
+    travel_picker(game, key="card")
+
+    st.divider()
+    st.write(f"##### ▼ {current_player} が持っているカード")
+    my_cards = game.cards_of(current_player)
     
-    base_score = len(my_stamps)
-    total_score = base_score
-    details = [{"name": "🎫 スタンプ数", "points": base_score, "matched_stations": my_stamps}]
+    if len(my_cards) == 0:
+        st.info("まだカードを持っていません")
+    else:
+        for i, (card_id, card) in enumerate(zip(game.player_cards[current_player], my_cards)):
+            with st.expander(f"🎫 {card['name']}"):
+                st.write(card['desc']) 
+                st.button("このカードを使う", key=f"use_{i}", on_click=use_card,
+                          args=(current_player, i, card_id, card['name']))
+
+@st.fragment
+@metrics.instrument("tab_stamps")
+def stamp_panel():
+    game = current_game()
+    current_player = game.current_player
+    st.header("💮 スタンプ帳")
     
-    my_stamps_set = set(my_stamps)
+    # 1. 新しいスタンプをゲット
+    st.subheader("📍 新しいスタンプをゲット！")
+    available_stations = game.available_stations()
     
-    for rule in BONUS_RULES:
-        target_stations = set(rule["stations"])
-        match_stations = list(my_stamps_set & target_stations)
-        match_count = len(match_stations)
-        
-        bonus_points = 0
-        if rule["type"] == "any":
-            if match_count >= rule["threshold"]:
-                bonus_points = rule["points"]
-        elif rule["type"] == "all":
-            if match_count == len(target_stations):
-                bonus_points = rule["points"]
-        
-        if bonus_points > 0:
-            total_score += bonus_points
-            details.append({
-                "name": rule["name"], 
-                "points": bonus_points, 
-                "matched_stations": match_stations 
-            })
-            
-    return total_score, details
+    if available_stations:
+        col_get1, col_get2 = st.columns([3, 1])
+        with col_get1:
+            target_station = pick_station("ゲットする駅", available_stations, key="get_station_select")
+        with col_get2:
+            # ボタンの縦位置を揃えるための空行
+            st.write("")
+            st.write("")
+            if st.button("ゲットする！", key="get_stamp") and target_station:
+                if act("get", target_station, current_player) is not None:
+                    st.toast(f"やった！ {current_player} が「{target_station}」のスタンプをゲットした！")
+                    st.rerun()
+    else:
+        st.info("すべてのスタンプが誰かに取られました！ここからは奪い合いです！")
 
-def go_to_next_player():
-    if len(st.session_state.finished_players) >= len(st.session_state.players):
-        st.session_state.game_ended = True
-        return
+    st.divider()
+
+    # 2. スタンプの移動（イベント用）
+    st.subheader("🎁 スタンプの移動（イベント用）")
+    col_move1, col_move2, col_move3 = st.columns(3)
+    with col_move1:
+        from_player = st.selectbox("誰から？", game.players, index=game.current_player_idx, key="move_from")
+    from_player_stamps = game.stamps_of(from_player)
+    with col_move2:
+        if from_player_stamps:
+            move_station = pick_station("どのスタンプを？", from_player_stamps, key="move_station")
+        else:
+            move_station = None
+            st.warning("スタンプを持っていません")
+    with col_move3:
+        to_player = st.selectbox("誰へ？", game.players, key="move_to")
         
-    current = st.session_state.current_player_idx
-    for _ in range(len(st.session_state.players)):
-        current = (current + 1) % len(st.session_state.players)
-        if st.session_state.players[current] not in st.session_state.finished_players:
-            st.session_state.current_player_idx = current
-            break
-            
-    st.session_state.dice_result = None
-    st.session_state.current_station_data = None
+    if st.button("スタンプを移動させる", key="move_btn"):
+        if move_station and from_player != to_player:
+            if act("move", move_station, from_player, to_player) is not None:
+                st.toast(f"「{move_station}」のスタンプが {from_player} から {to_player} に移動しました！")
+                st.rerun()
+        elif from_player == to_player:
+            st.error("自分には移動できません")
+        else:
+            st.error("移動できるスタンプがありません")
+
+    st.divider()
+
+    # 3. 【NEW!】スタンプを戻す（間違えた時用）
+    st.subheader("↩️ スタンプを戻す")
+    st.write("間違えてスタンプを取得した場合や一発逆転マスで間違えた場合、指定のスタンプを誰のものでもない状態に戻します。")
+    col_ret1, col_ret2, col_ret3 = st.columns(3)
+    with col_ret1:
+        ret_player = st.selectbox("誰のスタンプ？", game.players, index=game.current_player_idx, key="ret_player")
+    ret_player_stamps = game.stamps_of(ret_player)
+    with col_ret2:
+        if ret_player_stamps:
+            ret_station = pick_station("どのスタンプを戻す？", ret_player_stamps, key="ret_station")
+        else:
+            ret_station = None
+            st.warning("スタンプを持っていません")
+    with col_ret3:
+        st.write("")
+        st.write("")
+        if st.button("元に戻す", key="return_btn"):
+            if ret_station:
+                if act("return", ret_station) is not None:
+                    st.toast(f"「{ret_station}」のスタンプを元に戻しました！")
+                    st.rerun()
+            else:
+                st.error("戻せるスタンプがありません")
+
+    st.divider()
+    
+    # 4. みんなのスタンプ状況
+    st.subheader("📊 みんなのスタンプ状況")
+    for p in game.players:
+        p_stamps = game.stamps_of(p)
+        with st.expander(f"{p} のスタンプ ({len(p_stamps)}枚)"):
+            if p_stamps:
+                st.write(" / ".join(p_stamps))
+            else:
+                st.write("なし")
 
-df = load_data()
+@st.fragment
+def undo_panel():
+    # 取り消す操作は押したときに操作ログから読む（ほかのパネルだけ再実行されていても最新になる）
+    if st.button("↩️ ひとつ前に戻す", key="undo_btn"):
+        st.session_state.confirm_undo = True
+    if st.session_state.get("confirm_undo"):
+        last_actions = store.history(st.session_state.room, limit=1)
+        if not last_actions:
+            st.caption("取り消せる操作はありません")
+            st.session_state.confirm_undo = False
+            return
+        st.caption(f"「{describe_action(last_actions[0])}」を取り消しますか？")
+        col_yes, col_no = st.columns(2)
+        with col_yes:
+            if st.button("取り消す", key="undo_yes"):
+                st.session_state.confirm_undo = False
+                store.undo(st.session_state.room)
+                st.rerun()
+        with col_no:
+            if st.button("やめる", key="undo_no"):
+                st.session_state.confirm_undo = False
+                st.rerun(scope="fragment")
 
 # ==========================================
 # セッション状態の初期化
 # ==========================================
-if 'game_started' not in st.session_state:
-    st.session_state.game_started = False
-if 'game_ended' not in st.session_state:
-    st.session_state.game_ended = False
-if 'players' not in st.session_state:
-    st.session_state.players = [] 
-if 'current_player_idx' not in st.session_state:
-    st.session_state.current_player_idx = 0 
-if 'player_cards' not in st.session_state:
-    st.session_state.player_cards = {} 
-if 'finished_players' not in st.session_state:
-    st.session_state.finished_players = [] 
-if 'stamp_owners' not in st.session_state:
-    if df is not None:
-        all_stations = df['駅名'].unique()
-        st.session_state.stamp_owners = {station: None for station in all_stations}
-    else:
-        st.session_state.stamp_owners = {}
-if 'dice_count' not in st.session_state:
-    st.session_state.dice_count = 0
-if 'dice_result' not in st.session_state:
-    st.session_state.dice_result = None
-if 'current_station_data' not in st.session_state:
-    st.session_state.current_station_data = None
-if 'used_quiz_indices' not in st.session_state:
-    st.session_state.used_quiz_indices = []
+# ゲーム本体はサーバー側のストアにルームコードで保存し、セッションはルームコードだけを持つ
+if 'room' not in st.session_state:
+    st.session_state.room = st.query_params.get("room")
+    st.session_state.watching = st.query_params.get("watch") == "1"
+# 計測用のセッションID（SUGOROKU_METRICS を指定したときだけ使う）
+if 'metrics_session' not in st.session_state:
+    st.session_state.metrics_session = secrets.token_hex(4)
+metrics.count("reruns", st.session_state.metrics_session)
+
+game = store.load(st.session_state.room) if st.session_state.room else None
+if game is None:
+    st.session_state.room = None
+elif metrics.ENABLED:
+    metrics.gauge("session_memory_bytes", game.memory_report()["total"], st.session_state.metrics_session)
 
 # ==========================================
 # フェーズ1: ゲーム開始前の設定画面
 # ==========================================
-if not st.session_state.game_started:
+def setup_screen():
     st.title("🚄 新幹線すごろく セットアップ")
     
-    if df is None:
-        st.error("エラー：'quiz_data.csv' が見つかりません。フォルダに配置してください。")
+    if quiz is None:
+        st.error(f"エラー：'{quiz_store.DEFAULT_PATH}' が見つかりません。フォルダに配置してください。")
     else:
+        with st.expander("🔑 ルームコードで続きから遊ぶ"):
+            join_room = st.text_input("ルームコード", max_chars=game_store.ROOM_LENGTH, key="join_room")
+            if st.button("参加する", key="join_btn"):
+                join_room = join_room.strip().upper()
+                if store.exists(join_room):
+                    st.session_state.room = join_room
+                    st.query_params["room"] = join_room
+                    st.rerun()
+                else:
+                    st.error("そのルームコードのゲームは見つかりません")
+            if live is not None and st.button("👀 観戦する", key="watch_btn"):
+                join_room = join_room.strip().upper()
+                if store.exists(join_room):
+                    st.session_state.room = join_room
+                    st.session_state.watching = True
+                    st.query_params["room"] = join_room
+                    st.query_params["watch"] = "1"
+                    st.rerun()
+                else:
+                    st.error("そのルームコードのゲームは見つかりません")
+
         st.write("まずはプレイヤーを登録してね！")
         num_players = st.number_input("プレイする人数", min_value=1, max_value=6, value=2)
         
         with st.form("setup_form"):
             player_names = []
+            bot_names = []
             for i in range(num_players):
-                name = st.text_input(f"プレイヤー {i+1} の名前", value=f"プレイヤー{i+1}")
+                col_name, col_bot = st.columns([3, 1])
+                name = col_name.text_input(f"プレイヤー {i+1} の名前", value=f"プレイヤー{i+1}")
+                col_bot.write("")
+                if col_bot.checkbox("🤖 コンピューター", key=f"bot_{i}"):
+                    bot_names.append(name)
                 player_names.append(name)
+
+            finite_deck = st.checkbox("イベントカードを山札にする（一巡するまで同じカードは決まった枚数しか出ない）")
+            seed_text = st.text_input("シード（同じ数字にすると同じサイコロの目・カード・出題順になる。空欄ならランダム）")
             
             submitted = st.form_submit_button("ゲームスタート！")
             
             if submitted:
-                st.session_state.players = player_names
-                st.session_state.player_cards = {name: [] for name in player_names}
-                all_stations = df['駅名'].unique()
-                st.session_state.stamp_owners = {station: None for station in all_stations}
-                st.session_state.used_quiz_indices = []
-                st.session_state.finished_players = []
-                st.session_state.game_started = True
-                st.session_state.game_ended = False
+                seed = int(seed_text) if seed_text.strip().isdigit() else None
+                room = store.new_room()
+                store.create(room, Game(player_names, quiz.stations, seed=seed, finite_deck=finite_deck, bots=bot_names))
+                st.session_state.room = room
+                st.query_params["room"] = room
                 st.rerun()
 
+# ==========================================
+# 観戦画面（ライブ中継だけを表示。スクリプトは再実行されず、中継の部分だけが更新される）
+# ==========================================
+def watch_screen():
+    st.title(f"👀 新幹線すごろく 観戦中（ルーム {st.session_state.room}）")
+    live_view(height=480)
+    if st.button("観戦をやめる"):
+        leave_room()
+        st.rerun()
+
 # ==========================================
 # フェーズ3: ゲーム終了画面（優勝発表）
 # ==========================================
-elif st.session_state.game_ended:
+def results_screen():
     st.balloons()
     st.title("🎉 結果発表 🎉")
     st.write("最終得点（スタンプ数 ＋ ボーナス点）で順位が決まります！")
     
-    results = []
-    for p in st.session_state.players:
-        score, details = calculate_score(p, st.session_state.stamp_owners)
-        results.append({"player": p, "score": score, "details": details})
-    
-    results.sort(key=lambda x: x["score"], reverse=True)
+    results = game.results()
     winner = results[0]
     
     st.markdown(f"<div class='winner-text'>🏆 優勝 🏆<br>{winner['player']} さん！</div>", unsafe_allow_html=True)
@@ -293,21 +496,25 @@ elif st.session_state.game_ended:
             st.divider()
     
     if st.button("もう一度遊ぶ"):
-        st.session_state.clear()
+        leave_room()
         st.rerun()
 
 # ==========================================
 # フェーズ2: メインゲーム画面
 # ==========================================
-else:
-    current_player = st.session_state.players[st.session_state.current_player_idx]
+def main_screen():
+    current_player = game.current_player
     
     # --- サイドバー ---
     with st.sidebar:
         st.title("🎮 進行状況")
+        st.write(f"🔑 ルームコード: **{st.session_state.room}**")
+        st.caption("ほかの端末でもこのコードを入れると続きから遊べます")
+        if live is not None:
+            st.caption(f"📡 観戦用のURL: {sync_hub.room_url(st.session_state.room)}")
         st.write("▼ 参加プレイヤー")
-        for p in st.session_state.players:
-            if p in st.session_state.finished_players:
+        for p in game.players:
+            if p in game.finished_players:
                 st.write(f"🎉 **{p}** <span style='color:#888;'>(ゴール済み)</span>", unsafe_allow_html=True)
             elif p == current_player:
                 st.write(f"👉 **{p}**")
@@ -316,201 +523,77 @@ else:
                 
         st.write("---")
         if st.button("次のプレイヤーへ交代 ⏭️"):
-            go_to_next_player()
-            st.rerun()
+            if act("next") is not None:
+                st.rerun()
             
         if st.button("🏁 ゴール！（上がり）"):
-            st.session_state.finished_players.append(current_player)
-            st.success(f"🎉 {current_player} さんがゴールしました！")
-            go_to_next_player() 
-            st.rerun()
+            if act("goal", current_player) is not None:
+                st.toast(f"🎉 {current_player} さんがゴールしました！")
+                st.rerun()
+
+        # 操作ログから1手ずつ取り消す
+        undo_panel()
             
         st.write("---")
         st.write("📊 **現在のスタンプ数**")
-        counts = {p: 0 for p in st.session_state.players}
-        for owner in st.session_state.stamp_owners.values():
-            if owner in counts:
-                counts[owner] += 1
-        sorted_counts = sorted(counts.items(), key=lambda x: x[1], reverse=True)
-        for p, count in sorted_counts:
+        counts = game.stamp_counts()
+        totals = game.scores.totals()
+        sorted_totals = sorted(totals.items(), key=lambda x: x[1], reverse=True)
+        for p, total in sorted_totals:
             marker = "👉" if p == current_player else "　"
-            st.write(f"{marker} **{p}**: {count}枚")
+            st.write(f"{marker} **{p}**: {counts[p]}枚（{total}点）")
+            near = game.scores.near_misses(p)
+            if near:
+                st.caption("あと1枚！ " + " / ".join(f"{name} {count}/{need}" for name, count, need in near))
             
         st.write("---")
         with st.expander("開発者メニュー"):
+            st.caption(f"シード: {game.seed}")
+            memory = game.memory_report()
+            st.caption(f"このゲームのメモリ: {memory['total'] / 1024:.1f} KB")
             if st.button("強制終了して結果を見る"):
-                st.session_state.game_ended = True
-                st.rerun()
+                if act("end") is not None:
+                    st.rerun()
             if st.button("ゲームをリセット", type="secondary"):
-                st.session_state.clear()
+                leave_room()
                 st.rerun()
 
     # --- メインエリア ---
     st.title(f"🚄 新幹線すごろく ({current_player}のターン)")
 
+    if current_player in game.bots:
+        st.info(f"🤖 {current_player} はコンピューターです")
+        if st.button(f"🤖 {current_player} のターンを進める", key="bot_turn"):
+            bots.play_turn(game, act, bots.get_policy(game.rules), load=current_game)
+            st.rerun()
+
+    if live is not None:
+        with st.expander("📡 ライブ中継（ほかの端末の操作もすぐ反映されます）"):
+            live_view()
+
     tab1, tab2, tab3, tab4 = st.tabs(["🎲 サイコロ", "❓ クイズ", "🎒 アイテム", "💮 スタンプ"])
 
-    # タブ1: サイコロ
     with tab1:
-        st.header(f"{current_player} さん、サイコロを振ってね")
-        col1, col2 = st.columns([1, 2])
-        with col1:
-             if st.button("サイコロを振る！", key="dice_btn"):
-                st.session_state.dice_count += 1
-                st.session_state.dice_result = random.randint(1, 6)
-        with col2:
-            if st.session_state.dice_result is not None:
-                st.markdown(f"<div style='font-size:80px; font-weight:bold; color:#0066cc;'>🎲 {st.session_state.dice_result}</div>", unsafe_allow_html=True)
-                num = st.session_state.dice_result
-                if num >= 5:
-                    st.success("たくさん進めるね！🚀")
-
-    # タブ2: クイズ
+        dice_panel()
     with tab2:
-        st.header("駅のクイズ")
-        st.write("ランダムに問題が出るよ！（同じ問題は出ないようになってるよ）")
-        if df is not None:
-            if st.button("問題を出題する！", key="quiz_btn"):
-                all_indices = df.index.tolist()
-                available_indices = [i for i in all_indices if i not in st.session_state.used_quiz_indices]
-                
-                if not available_indices:
-                    st.session_state.used_quiz_indices = [] 
-                    available_indices = all_indices 
-                    st.toast("全問制覇おめでとう！問題がリセットされました♻️") 
-                
-                chosen_index = random.choice(available_indices)
-                st.session_state.used_quiz_indices.append(chosen_index)
-                st.session_state.current_station_data = df.loc[chosen_index]
-            
-            if st.session_state.current_station_data is not None:
-                station_data = st.session_state.current_station_data
-                st.divider()
-                st.markdown(f"### 📍 {station_data['駅名']}駅")
-                st.markdown(f"<div class='big-font'>{station_data['問題文']}</div>", unsafe_allow_html=True)
-                st.write("") 
-                if pd.notna(station_data['選択肢A']):
-                    st.markdown(f"**A.** {station_data['選択肢A']}")
-                    st.markdown(f"**B.** {station_data['選択肢B']}")
-                    st.markdown(f"**C.** {station_data['選択肢C']}")
-                st.write("---")
-                with st.expander("答えを見る"):
-                    st.markdown(f"### 正解は... **{station_data['正解']}**")
-                    if '解説' in df.columns and pd.notna(station_data['解説']):
-                        st.info(f"💡 解説：{station_data['解説']}")
-
-    # タブ3: イベントカード
+        quiz_panel()
     with tab3:
-        st.header(f"🎒 {current_player} のアイテム")
-        st.write("##### ▼ カードを引く")
-        
-        if st.button("イベントカードを引く！", key="draw_card"):
-            weights = [card['weight'] for card in EVENT_DECK_DATA]
-            drawn_card = random.choices(EVENT_DECK_DATA, weights=weights, k=1)[0].copy()
-            st.session_state.player_cards[current_player].append(drawn_card)
-            st.success(f"「{drawn_card['name']}」を手に入れた！")
-            st.rerun()
-
-        st.divider()
-        st.write(f"##### ▼ {current_player} が持っているカード")
-        my_cards = st.session_state.player_cards[current_player]
-        
-        if len(my_cards) == 0:
-            st.info("まだカードを持っていません")
-        else:
-            for i, card in enumerate(my_cards):
-                with st.expander(f"🎫 {card['name']}"):
-                    st.write(card['desc']) 
-                    if st.button("このカードを使う", key=f"use_{i}"):
-                        my_cards.pop(i)
-                        st.session_state.player_cards[current_player] = my_cards
-                        st.success(f"「{card['name']}」を使った！")
-                        st.rerun()
-
-    # タブ4: スタンプ管理
+        card_panel()
     with tab4:
-        st.header("💮 スタンプ帳")
-        
-        # 1. 新しいスタンプをゲット
-        st.subheader("📍 新しいスタンプをゲット！")
-        available_stations = [s for s, owner in st.session_state.stamp_owners.items() if owner is None]
-        
-        if available_stations:
-            col_get1, col_get2 = st.columns([3, 1])
-            with col_get1:
-                target_station = st.selectbox("駅を選択（文字入力で検索できます）", available_stations, key="get_station_select")
-            with col_get2:
-                # ボタンの縦位置を揃えるための空行
-                st.write("")
-                st.write("")
-                if st.button("ゲットする！", key="get_stamp"):
-                    st.session_state.stamp_owners[target_station] = current_player
-                    st.success(f"やった！ {current_player} が「{target_station}」のスタンプをゲットした！")
-                    st.rerun()
-        else:
-            st.info("すべてのスタンプが誰かに取られました！ここからは奪い合いです！")
-
-        st.divider()
-
-        # 2. スタンプの移動（イベント用）
-        st.subheader("🎁 スタンプの移動（イベント用）")
-        col_move1, col_move2, col_move3 = st.columns(3)
-        with col_move1:
-            from_player = st.selectbox("誰から？", st.session_state.players, index=st.session_state.current_player_idx, key="move_from")
-        from_player_stamps = [s for s, owner in st.session_state.stamp_owners.items() if owner == from_player]
-        with col_move2:
-            if from_player_stamps:
-                move_station = st.selectbox("どのスタンプを？", from_player_stamps, key="move_station")
-            else:
-                move_station = None
-                st.warning("スタンプを持っていません")
-        with col_move3:
-            to_player = st.selectbox("誰へ？", st.session_state.players, key="move_to")
-            
-        if st.button("スタンプを移動させる", key="move_btn"):
-            if move_station and from_player != to_player:
-                st.session_state.stamp_owners[move_station] = to_player
-                st.success(f"「{move_station}」のスタンプが {from_player} から {to_player} に移動しました！")
-                st.rerun()
-            elif from_player == to_player:
-                st.error("自分には移動できません")
-            else:
-                st.error("移動できるスタンプがありません")
-
-        st.divider()
-
-        # 3. 【NEW!】スタンプを戻す（間違えた時用）
-        st.subheader("↩️ スタンプを戻す")
-        st.write("間違えてスタンプを取得した場合や一発逆転マスで間違えた場合、指定のスタンプを誰のものでもない状態に戻します。")
-        col_ret1, col_ret2, col_ret3 = st.columns(3)
-        with col_ret1:
-            ret_player = st.selectbox("誰のスタンプ？", st.session_state.players, index=st.session_state.current_player_idx, key="ret_player")
-        ret_player_stamps = [s for s, owner in st.session_state.stamp_owners.items() if owner == ret_player]
-        with col_ret2:
-            if ret_player_stamps:
-                ret_station = st.selectbox("どのスタンプを戻す？", ret_player_stamps, key="ret_station")
-            else:
-                ret_station = None
-                st.warning("スタンプを持っていません")
-        with col_ret3:
-            st.write("")
-            st.write("")
-            if st.button("元に戻す", key="return_btn"):
-                if ret_station:
-                    st.session_state.stamp_owners[ret_station] = None
-                    st.success(f"「{ret_station}」のスタンプを元に戻しました！")
-                    st.rerun()
-                else:
-                    st.error("戻せるスタンプがありません")
+        stamp_panel()
 
-        st.divider()
-        
-        # 4. みんなのスタンプ状況
-        st.subheader("📊 みんなのスタンプ状況")
-        for p in st.session_state.players:
-            p_stamps = [s for s, owner in st.session_state.stamp_owners.items() if owner == p]
-            with st.expander(f"{p} のスタンプ ({len(p_stamps)}枚)"):
-                if p_stamps:
-                    st.write(" / ".join(p_stamps))
-                else:
-                    st.write("なし")
\ No newline at end of file
+# ==========================================
+# 画面の切り替え
+# ==========================================
+if game is None:
+    with metrics.timed("phase_setup"):
+        setup_screen()
+elif live is not None and st.session_state.get("watching"):
+    with metrics.timed("phase_watch"):
+        watch_screen()
+elif game.game_ended:
+    with metrics.timed("phase_results"):
+        results_screen()
+else:
+    with metrics.timed("phase_main"):
+        main_screen()
@@ -0,0 +1,106 @@
+# ==========================================
+# ボットの判断速度のベンチマーク
+# ボットだけのゲームを画面を通さずに engine の上で回して、判断の種類ごとの
+# 時間（p50/p99/最大）、1秒あたりの判断数、持ち時間を超えた回数、局面メモの当たり率を測る。
+#
+# 使い方（リポジトリの直下で）:
+#   python benchmarks/bot_benchmark.py --games 200 --players 4
+#   python benchmarks/bot_benchmark.py --budget 0.001 --output bots.json
+# ==========================================
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import bots
+import quiz_store
+from engine import Game
+from load_test import summarize
+
+DECISIONS = ("choose_stamp", "choose_victim", "choose_destination", "choose_card")
+
+def timed_policy(policy, timings):
+    # 判断のメソッドを、かかった時間を timings に記録するものに差し替える
+    for name in DECISIONS:
+        method = getattr(policy, name)
+
+        def wrapper(*args, _method=method, _name=name):
+            start = time.perf_counter()
+            result = _method(*args)
+            timings.setdefault(_name, []).append(time.perf_counter() - start)
+            return result
+        setattr(policy, name, wrapper)
+    return policy
+
+def run(games, players, turns, budget, seed, data):
+    stations = quiz_store.load(str(ROOT / data)).stations
+    names = [f"BOT{i + 1}" for i in range(players)]
+    policy = None
+    timings = {}
+    seat_scores = [0] * players
+    total_turns = 0
+
+    start = time.perf_counter()
+    for g in range(games):
+        game = Game(names, stations, seed=seed + g, bots=names)
+        if policy is None:
+            policy = timed_policy(bots.BotPolicy(game.rules, budget=budget), timings)
+
+        def act(*action):
+            return game.apply(action)
+
+        for _ in range(turns * players):
+            bots.play_turn(game, act, policy)
+            total_turns += 1
+        for i, p in enumerate(names):
+            seat_scores[i] += game.scores.total(p)
+    wall = time.perf_counter() - start
+
+    decisions = sum(len(v) for v in timings.values())
+    lookups = policy.memo_hits + policy.memo_misses
+    return {
+        "config": {"games": games, "players": players, "turns": turns, "budget_ms": budget * 1000, "seed": seed},
+        "wall_seconds": round(wall, 3),
+        "turns_per_sec": round(total_turns / wall, 1),
+        "decisions": decisions,
+        "decisions_per_sec": round(decisions / wall, 1),
+        "per_decision": {name: summarize(values) for name, values in sorted(timings.items())},
+        "over_budget": policy.over_budget,
+        "memo_hit_rate": round(policy.memo_hits / lookups, 3) if lookups else 0.0,
+        "mean_seat_scores": [round(s / games, 2) for s in seat_scores],
+    }
+
+def print_report(report):
+    c = report["config"]
+    print(f"🤖 {c['games']} ゲーム / {c['players']} 人 / {c['turns']} 周 / 持ち時間 {c['budget_ms']} ms")
+    print(f"{report['turns_per_sec']} ターン/秒 / {report['decisions_per_sec']} 判断/秒 / "
+          f"持ち時間超え {report['over_budget']} 回 / 局面メモの当たり率 {report['memo_hit_rate']}")
+    print(f"{'判断':<20}{'回数':>8}{'p50':>10}{'p99':>10}{'max':>10}  (ms)")
+    for name, s in report["per_decision"].items():
+        print(f"{name:<20}{s['count']:>8}{s['p50_ms']:>10}{s['p99_ms']:>10}{s['max_ms']:>10}")
+    print("席順ごとの平均点: " + ", ".join(map(str, report["mean_seat_scores"])))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="新幹線すごろくのボットの判断速度ベンチマーク")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=20, help="1ゲームで回す周回数")
+    parser.add_argument("--budget", type=float, default=bots.BUDGET, help="1回の判断の持ち時間（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data", default=quiz_store.DEFAULT_PATH, help="駅一覧を読むクイズデータ")
+    parser.add_argument("--output", help="結果を保存するJSON")
+    args = parser.parse_args(argv)
+
+    report = run(args.games, args.players, args.turns, args.budget, args.seed, args.data)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+# ==========================================
+# 同時セッションの負荷テスト・再実行ベンチマーク
+# Streamlit のヘッドレス実行（streamlit.testing.v1.AppTest）で app.py を動かし、
+# セットアップ → サイコロ → クイズ → カード → スタンプ（ゲット/移動/戻す）→ ゴール → 結果発表
+# までのゲームを N セッション同時に最後まで進めて、操作ごとの再実行時間を測る。
+#
+# 使い方（リポジトリの直下で）:
+#   python benchmarks/load_test.py --sessions 8 --players 4 --rounds 3 --output benchmarks/baseline.json
+#   python benchmarks/load_test.py --sessions 8 --compare benchmarks/baseline.json
+#
+# 注意: AppTest ではフラグメントの中のボタンもスクリプト全体の再実行になるので、
+# ここで測るのは「全体を再実行したときの時間」（実際のブラウザではこれ以下になる）。
+# AppTest はプロセス内で1つしか動かせないので、セッションごとに別プロセスで動かす
+# （ゲームの保存先のDBは全セッションで共有する）
+# ==========================================
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+APP_PATH = str(ROOT / "app.py")
+sys.path.insert(0, str(ROOT))
+
+# ==========================================
+# 1セッション分のゲーム
+# ==========================================
+class Session:
+    def __init__(self, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.timings = {}
+
+    def timed(self, action, widget=None):
+        # widget を操作して（なければそのまま）再実行し、かかった時間を action に記録する
+        start = time.perf_counter()
+        if widget is None:
+            self.at.run()
+        else:
+            widget.run()
+        elapsed = time.perf_counter() - start
+        if self.at.exception:
+            raise RuntimeError(f"{action}: {self.at.exception[0].message}")
+        self.timings.setdefault(action, []).append(elapsed)
+
+    def button(self, key=None, label=None, sidebar=False):
+        buttons = self.at.sidebar.button if sidebar else self.at.button
+        for b in buttons:
+            if (key is not None and b.key == key) or (label is not None and b.label == label):
+                return b
+        return None
+
+    def play(self, num_players, rounds):
+        at = self.at
+        self.timed("load")
+        at.number_input[0].set_value(num_players)
+        self.timed("setup_players", at.number_input[0])
+        self.timed("setup_start", self.button(label="ゲームスタート！").click())
+
+        for _ in range(rounds * num_players):
+            self.timed("dice", self.button("dice_btn").click())
+            go = self.button("dice_go")
+            if go is not None:
+                self.timed("travel", go.click())
+            self.timed("quiz", self.button("quiz_btn").click())
+            self.timed("card_draw", self.button("draw_card").click())
+            use = self.button("use_0")
+            if use is not None:
+                self.timed("card_use", use.click())
+            get = self.button("get_stamp")
+            if get is not None:
+                self.timed("stamp_get", get.click())
+            if num_players > 1:
+                move_to = at.selectbox(key="move_to")
+                self.timed("stamp_select", move_to.select(move_to.options[-1]))
+                self.timed("stamp_move", self.button("move_btn").click())
+            self.timed("stamp_return", self.button("return_btn").click())
+            self.timed("next", self.button(label="次のプレイヤーへ交代 ⏭️", sidebar=True).click())
+
+        # 全員ゴール → 最後のゴールで結果発表の画面になる
+        for _ in range(num_players):
+            self.timed("goal", self.button(label="🏁 ゴール！（上がり）", sidebar=True).click())
+        if not any("結果発表" in t.value for t in at.title):
+            raise RuntimeError("結果発表の画面になりませんでした")
+        self.timed("results")
+
+# ==========================================
+# 集計
+# ==========================================
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "mean_ms": round(statistics.fmean(values) * 1000, 3),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p90_ms": round(percentile(values, 90) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3),
+    }
+
+def peak_rss_mb():
+    # Linux は KB、macOS は バイト
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+# ==========================================
+# 部品ごとの計測（画面を通さずに engine の処理だけを測る）
+# ==========================================
+def micro_benchmarks(repeat=2000):
+    import random
+    import quiz_store
+    from engine import Game
+
+    store = quiz_store.load(str(ROOT / "quiz_data.csv"))
+    players = [f"P{i}" for i in range(6)]
+    game = Game(players, store.stations, seed=0)
+    rng = random.Random(0)
+    for station in rng.sample(store.stations, len(store.stations) // 2):
+        game.get_stamp(station, rng.choice(players))
+
+    def bench(fn):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return round((time.perf_counter() - start) / repeat * 1e6, 3)
+
+    return {
+        "score_all_players_us": bench(game.results),
+        "stamp_views_us": bench(lambda: (game.available_stations(), [game.stamps_of(p) for p in players], game.stamp_counts())),
+        "live_scores_us": bench(lambda: [game.scores.near_misses(p) for p in players]),
+        "quiz_draw_us": bench(lambda: game.draw_quiz(len(store))),
+        "board_reach_us": bench(lambda: game.board.destinations("東京", 6)),
+    }
+
+# ==========================================
+# 実行
+# ==========================================
+def play_session(players, rounds, timeout):
+    # ワーカープロセスで1セッション分を最後まで遊ぶ
+    session = Session(timeout)
+    error = None
+    try:
+        session.play(players, rounds)
+    except Exception as e:
+        error = repr(e)
+    return session.timings, error, peak_rss_mb()
+
+def run(sessions, players, rounds, timeout):
+    timings = {}
+    errors = []
+    session_rss = []
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=sessions) as pool:
+        jobs = [pool.submit(play_session, players, rounds, timeout) for _ in range(sessions)]
+        for job in jobs:
+            session_timings, error, rss = job.result()
+            for action, values in session_timings.items():
+                timings.setdefault(action, []).extend(values)
+            if error:
+                errors.append(error)
+            session_rss.append(rss)
+    wall = time.perf_counter() - start
+
+    total_actions = sum(len(v) for v in timings.values())
+    all_values = [v for values in timings.values() for v in values]
+    return {
+        "config": {"sessions": sessions, "players": players, "rounds": rounds},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "wall_seconds": round(wall, 3),
+        "actions": total_actions,
+        "throughput_actions_per_sec": round(total_actions / wall, 2) if wall else 0.0,
+        "overall": summarize(all_values) if all_values else {},
+        "per_action": {action: summarize(values) for action, values in sorted(timings.items())},
+        "peak_rss_mb": max(session_rss, default=0.0),
+        "micro": micro_benchmarks(),
+        "errors": errors,
+    }
+
+def compare(report, baseline, threshold):
+    # p50/p90 と部品ごとの時間が threshold（割合）以上悪くなったものを返す
+    regressions = []
+    for action, now in report["per_action"].items():
+        before = baseline.get("per_action", {}).get(action)
+        if not before:
+            continue
+        for key in ("p50_ms", "p90_ms"):
+            if before[key] and now[key] > before[key] * (1 + threshold):
+                regressions.append(f"{action} {key}: {before[key]} → {now[key]}")
+    for key, now in report["micro"].items():
+        before = baseline.get("micro", {}).get(key)
+        if before and now > before * (1 + threshold):
+            regressions.append(f"micro {key}: {before} → {now}")
+    return regressions
+
+def print_report(report):
+    c = report["config"]
+    print(f"🚄 {c['sessions']} セッション同時 / {c['players']} 人 / {c['rounds']} 周")
+    print(f"操作数 {report['actions']} / {report['wall_seconds']} 秒 / "
+          f"{report['throughput_actions_per_sec']} 操作/秒 / 1セッションの最大RSS {report['peak_rss_mb']} MB")
+    print(f"{'操作':<16}{'回数':>6}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}  (ms)")
+    for action, s in report["per_action"].items():
+        print(f"{action:<16}{s['count']:>6}{s['p50_ms']:>10}{s['p90_ms']:>10}{s['p99_ms']:>10}{s['max_ms']:>10}")
+    print("部品ごと (µs): " + ", ".join(f"{k}={v}" for k, v in report["micro"].items()))
+    for error in report["errors"]:
+        print(f"⚠️ {error}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="新幹線すごろくの同時セッション負荷テスト")
+    parser.add_argument("--sessions", type=int, default=4, help="同時に遊ぶセッション数")
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=2, help="ゴールまでに回す周回数")
+    parser.add_argument("--timeout", type=float, default=60.0, help="1回の再実行のタイムアウト（秒）")
+    parser.add_argument("--output", help="結果を保存するJSON（ベースライン）")
+    parser.add_argument("--compare", help="比べるベースラインのJSON")
+    parser.add_argument("--threshold", type=float, default=0.2, help="悪化とみなす割合")
+    args = parser.parse_args(argv)
+
+    # アプリは相対パスで quiz_data.csv を読むのでリポジトリの直下で動かす。
+    # ゲームの保存先と終わったゲームの記録は使い捨てのディレクトリに書く
+    os.chdir(ROOT)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["SUGOROKU_DB"] = os.path.join(tmp, "bench.sqlite3")
+        os.environ["SUGOROKU_ARCHIVE"] = os.path.join(tmp, "bench_records.jsonl.gz")
+        report = run(args.sessions, args.players, args.rounds, args.timeout)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"📉 {line}")
+        if regressions:
+            return 1
+    return 1 if report["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
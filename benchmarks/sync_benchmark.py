@@ -0,0 +1,170 @@
+# ==========================================
+# ライブ中継（sync_hub）の配信ベンチマーク
+# ボットだけのゲームを複数ルームで回して、操作ごとの差分をハブから全視聴者に配り、
+# 差分を送ってから視聴者が受け取るまでの時間（p50/p99/最大）と、
+# ハブのスレッドが使ったCPU時間（視聴者1人に1件届けるあたり）を測る。
+# 視聴者は別プロセスで、実際のソケット越しに EventSource と同じ形で受け取る。
+#
+# 使い方（リポジトリの直下で）:
+#   python benchmarks/sync_benchmark.py --rooms 20 --players 6 --spectators 10
+#   python benchmarks/sync_benchmark.py --rooms 50 --rate 2000 --output sync.json
+# ==========================================
+import argparse
+import asyncio
+import json
+import multiprocessing
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import bots
+import quiz_store
+import sync_hub
+from engine import Game
+from game_store import ROOM_ALPHABET
+from load_test import summarize
+
+# ==========================================
+# 視聴者（別プロセス）
+# ==========================================
+async def _viewer(port, room, latencies, ready):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET /rooms/{room}/events HTTP/1.1\r\nHost: bench\r\n\r\n".encode("latin-1"))
+    await writer.drain()
+    ready.release()
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        if not line.startswith(b"data: "):
+            continue
+        patch = json.loads(line[6:])
+        if "t" in patch:
+            latencies.append(time.monotonic() - patch["t"])
+        if patch.get("end"):
+            break
+    writer.close()
+
+async def _viewers_main(port, rooms, per_room, conn):
+    latencies = []
+    ready = asyncio.Semaphore(0)
+    tasks = [asyncio.create_task(_viewer(port, room, latencies, ready)) for room in rooms for _ in range(per_room)]
+    for _ in tasks:
+        await ready.acquire()
+    conn.send("ready")
+    await asyncio.gather(*tasks)
+    conn.send(latencies)
+
+def _run_viewers(port, rooms, per_room, conn):
+    asyncio.run(_viewers_main(port, rooms, per_room, conn))
+
+# ==========================================
+# 計測
+# ==========================================
+def hub_cpu(hub):
+    # ハブのスレッドのCPU時間（ハブのイベントループの中で読む）
+    return asyncio.run_coroutine_threadsafe(_thread_time(), hub.loop).result()
+
+async def _thread_time():
+    return time.thread_time()
+
+def run(rooms, players, spectators, turns, rate, seed, port, data):
+    stations = quiz_store.load(str(ROOT / data)).stations
+    names = [f"BOT{i + 1}" for i in range(players)]
+    # ハブはルームコードに使える文字だけのルームしか受け付けない
+    room_codes = [f"B{a}{b}" for a in ROOM_ALPHABET for b in ROOM_ALPHABET][:rooms]
+    per_room = players + spectators
+
+    hub = sync_hub.start_hub("127.0.0.1", port)
+    parent, child = multiprocessing.Pipe()
+    viewers = multiprocessing.get_context("spawn").Process(
+        target=_run_viewers, args=(port, room_codes, per_room, child), daemon=True)
+    viewers.start()
+    if parent.recv() != "ready":
+        raise RuntimeError("視聴者の接続に失敗しました")
+    while hub.viewer_count() < rooms * per_room:
+        time.sleep(0.01)
+
+    def send(room, patch):
+        patch["t"] = time.monotonic()
+        hub.publish_threadsafe(room, patch)
+
+    publisher = sync_hub.Publisher(send)
+    games = {room: Game(names, stations, seed=seed + i, bots=names) for i, room in enumerate(room_codes)}
+    for room, game in games.items():
+        publisher(room, game)
+    policy = bots.BotPolicy(next(iter(games.values())).rules)
+
+    # ルームを順番に1ターンずつ進め、操作ごとに差分を配る（全ルーム合わせて rate 件/秒のペース）
+    cpu_start = hub_cpu(hub)
+    sent_start = hub.sent
+    start = time.perf_counter()
+    patches = 0
+    for _ in range(turns * players):
+        for room, game in games.items():
+            def act(*action, _room=room, _game=game):
+                nonlocal patches
+                event = _game.apply(action)
+                wait = start + patches / rate - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                publisher(_room, _game)
+                patches += 1
+                return event
+            bots.play_turn(game, act, policy)
+    for room in room_codes:
+        hub.publish_threadsafe(room, {"end": 1})
+    latencies = parent.recv()
+    wall = time.perf_counter() - start
+    cpu = hub_cpu(hub) - cpu_start
+    deliveries = hub.sent - sent_start
+    viewers.join(5)
+
+    return {
+        "config": {"rooms": rooms, "players": players, "spectators": spectators, "turns": turns,
+                   "rate": rate, "seed": seed},
+        "viewers": rooms * per_room,
+        "actions": patches,
+        "deliveries": deliveries,
+        "deliveries_per_sec": round(deliveries / wall, 1),
+        "latency": summarize(latencies),
+        "hub_cpu_us_per_delivery": round(cpu / deliveries * 1e6, 2) if deliveries else 0.0,
+        "hub_cpu_percent": round(cpu / wall * 100, 1),
+        "dropped": hub.dropped,
+    }
+
+def print_report(report):
+    c = report["config"]
+    lat = report["latency"]
+    print(f"📡 {c['rooms']} ルーム / 1ルーム {c['players']} 人 + 観戦 {c['spectators']} 人"
+          f"（視聴者 {report['viewers']} 人）/ {c['turns']} 周")
+    print(f"操作 {report['actions']} 件 → 配信 {report['deliveries']} 件（{report['deliveries_per_sec']} 件/秒）"
+          f" / 切断 {report['dropped']} 人")
+    print(f"配信の遅れ p50 {lat['p50_ms']} ms / p99 {lat['p99_ms']} ms / 最大 {lat['max_ms']} ms")
+    print(f"ハブのCPU: 1配信あたり {report['hub_cpu_us_per_delivery']} µs（CPU使用率 {report['hub_cpu_percent']}%）")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="新幹線すごろくのライブ中継の配信ベンチマーク")
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--spectators", type=int, default=10, help="1ルームあたりの観戦者数")
+    parser.add_argument("--turns", type=int, default=5, help="1ゲームで回す周回数")
+    parser.add_argument("--rate", type=float, default=500, help="全ルーム合わせた1秒あたりの操作数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--data", default=quiz_store.DEFAULT_PATH, help="駅一覧を読むクイズデータ")
+    parser.add_argument("--output", help="結果を保存するJSON")
+    args = parser.parse_args(argv)
+
+    report = run(args.rooms, args.players, args.spectators, args.turns, args.rate, args.seed, args.port, args.data)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+# ==========================================
+# 新幹線の路線図（すごろくの盤面）
+# BONUS_RULES の「〇〇新幹線好き」に並んでいる駅の順番をそのまま路線とみなし、
+# 同じ駅（盛岡・福島・新青森・新鳥栖など）でつながる路線と、
+# リストに出てこない乗り継ぎ（LINKS）を足して1つのグラフにする。
+#
+# 「この駅から k マス進んだら、どの駅に着いて、どの駅を通るか」を
+# 全部の駅・全部の k について最初に1回だけ計算しておくので、
+# ゲーム中やシミュレーションでは辞書を引くだけで進む先と通った駅がわかる
+# ==========================================
+import functools
+
+# 路線のリスト同士をつなぐ乗り継ぎ（リストの端どうしが別の駅のところ）
+LINKS = [
+    ("東京", "大宮"),        # 東北・上越・北陸新幹線は東京から
+    ("大宮", "小山"),        # 東北新幹線
+    ("高崎", "安中榛名"),    # 北陸新幹線
+    ("新大阪", "新神戸"),    # 東海道・山陽新幹線
+    ("小倉", "博多"),        # 山陽・九州新幹線
+]
+START_STATION = "東京"
+MAX_STEPS = 12  # 先に計算しておく最大のマス数（サイコロ × 2 まで）
+
+class Board:
+    # 駅は番号で持ち、通った駅は通った順の駅名のタプルで持つ
+    def __init__(self, lines, links=LINKS, max_steps=MAX_STEPS):
+        stations = []
+        for line in lines:
+            stations.extend(line)
+        for a, b in links:
+            stations.extend((a, b))
+        self.stations = tuple(dict.fromkeys(stations))
+        self.index = {s: i for i, s in enumerate(self.stations)}
+        self.max_steps = max_steps
+
+        neighbors = [set() for _ in self.stations]
+        edges = [pair for line in lines for pair in zip(line, line[1:])] + list(links)
+        for a, b in edges:
+            neighbors[self.index[a]].add(self.index[b])
+            neighbors[self.index[b]].add(self.index[a])
+        self.neighbors = tuple(tuple(sorted(n)) for n in neighbors)
+
+        # reach[駅番号][k] = {着く駅の番号: 通った駅（着いた駅を含む）}
+        self.reach = tuple(self._walk(i) for i in range(len(self.stations)))
+
+    def _walk(self, start):
+        # start から折り返さずに進む道を全部たどる。終点に着いたらそこで止まる
+        table = [{} for _ in range(self.max_steps + 1)]
+        table[0][start] = ()
+        stack = [(start, -1, 0, ())]   # (今の駅, ひとつ前の駅, 進んだマス, 通った駅)
+        while stack:
+            node, prev, steps, passed = stack.pop()
+            if steps == self.max_steps:
+                continue
+            ahead = [n for n in self.neighbors[node] if n != prev]
+            if not ahead:
+                for k in range(steps + 1, self.max_steps + 1):
+                    table[k].setdefault(node, passed)
+                continue
+            for n in ahead:
+                path = passed + (self.stations[n],)
+                table[steps + 1].setdefault(n, path)
+                stack.append((n, node, steps + 1, path))
+        return tuple(table)
+
+    def __contains__(self, station):
+        return station in self.index
+
+    def junctions(self):
+        return [s for s, n in zip(self.stations, self.neighbors) if len(n) > 2]
+
+    def destinations(self, station, steps):
+        # {着く駅: 通った駅}（steps は MAX_STEPS まで）
+        steps = min(steps, self.max_steps)
+        return {self.stations[i]: path for i, path in self.reach[self.index[station]][steps].items()}
+
+    def passed(self, station, steps, destination):
+        # station から steps マスで destination に着くときに通る駅（着いた駅を含む）。
+        # その道がなければ None
+        steps = min(steps, self.max_steps)
+        return self.reach[self.index[station]][steps].get(self.index.get(destination))
+
+@functools.lru_cache(maxsize=8)
+def build_board(lines, links=tuple(LINKS)):
+    # 路線の並びごとに1回だけ作って全ゲームで共有する
+    return Board(lines, links)
@@ -0,0 +1,291 @@
+# ==========================================
+# コンピューターのプレイヤー（ボット）
+# 「どのスタンプを取るか」「思い出の共有で誰から何をもらうか」「どのカードをいつ使うか」
+# 「路線図のどこへ進むか」を、ボーナスの達成に近づく度合い（限界価値）で決める。
+#
+# 1回の判断には持ち時間（BUDGET 秒）があり、まず候補を1手だけ読んで並べ、
+# 時間の許す限り上位の候補から「次の自分の手」まで読んで選び直す（次を読む時間が
+# 残っていなければ、その時点のいちばん良い手を返す）。
+# 駅は「どのボーナスに入っているか」が同じものを1つのグループにまとめ（同じグループの駅は
+# どれを取っても同じ値なので、候補はグループごとに1つだけ読む）、次の手の価値は
+# ボーナスごとの（持っている数, まだ取れる数）を点数に効くところまでに切り詰めたものを
+# キーにして覚えておく（達成済みのボーナスは (必要数, 0)、もう届かないものは (0, 0)）。
+# スタンプの顔ぶれが違っても、ゲームが違っても、点数に効く数が同じ局面なら計算し直さない
+# ==========================================
+import time
+
+BUDGET = 0.003          # 1回の判断の持ち時間（秒）
+LOOKAHEAD = 0.5         # 次の手の価値をどれだけ見るか
+DENY = 0.5              # 相手の邪魔をする価値をどれだけ見るか
+MEMO_SIZE = 1 << 16     # 覚えておく局面の数の上限
+
+MOVE_CARDS = ("新幹線乗り換え", "追加乗車＋")
+STAMP_CARDS = ("旅の思い出", "博識（はくしき）")
+# 引いたらすぐに使う（効果は自分にしかかからない）カード
+MUST_USE_CARDS = ("お土産の誘惑", "追加乗車ー")
+
+def rule_value(have, avail, need, points):
+    # ボーナス1つ分の見込みの点数（達成済みなら満点、もう届かなければ 0、途中なら近いほど高い）
+    if have >= need:
+        return points
+    if have + avail < need:
+        return 0.0
+    return points * (have / need) ** 2
+
+class BotPolicy:
+    def __init__(self, rules, budget=BUDGET):
+        self.rules = rules
+        self.budget = budget
+        self._memo = {}
+        # ボーナスの組み合わせが同じ駅のグループ: [(ルール番号のタプル, 駅のビットマスク)]
+        groups = {}
+        for i, rule_ids in enumerate(rules.rules_of):
+            groups[tuple(rule_ids)] = groups.get(tuple(rule_ids), 0) | (1 << i)
+        self._groups = list(groups.items())
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self.over_budget = 0
+
+    # --- 局面の評価 ---
+    def _counts(self, mask, unowned):
+        # ルールごとの (持っている数, まだ取れる数)
+        have = [(mask & m).bit_count() for m in self.rules.masks]
+        avail = [(unowned & m).bit_count() for m in self.rules.masks]
+        return have, avail
+
+    def _gain(self, i, have, avail, from_unowned=True):
+        # 駅 i のスタンプを取ったときに増える見込みの点数
+        return self._gain_of(self.rules.rules_of[i], have, avail, from_unowned)
+
+    def _gain_of(self, rule_ids, have, avail, from_unowned=True):
+        rules = self.rules
+        gain = 1.0
+        taken = 1 if from_unowned else 0
+        for r in rule_ids:
+            need, points = rules.need[r], rules.points[r]
+            gain += rule_value(have[r] + 1, avail[r] - taken, need, points) - rule_value(have[r], avail[r], need, points)
+        return gain
+
+    def _loss(self, i, have, avail, from_owner=False):
+        # 駅 i を取られたときに相手が失う見込みの点数（from_owner なら相手が持っているのを取られる）
+        return self._loss_of(self.rules.rules_of[i], have, avail, from_owner)
+
+    def _loss_of(self, rule_ids, have, avail, from_owner=False):
+        rules = self.rules
+        loss = 1.0 if from_owner else 0.0
+        for r in rule_ids:
+            need, points = rules.need[r], rules.points[r]
+            after = rule_value(have[r] - 1, avail[r], need, points) if from_owner else \
+                rule_value(have[r], avail[r] - 1, need, points)
+            loss += rule_value(have[r], avail[r], need, points) - after
+        return loss
+
+    def _key(self, have, avail):
+        # ボーナスごとの (持っている数, まだ取れる数) を点数に効くところまでに切り詰める
+        # （rule_value と _gain_of の値は切り詰める前と変わらない）
+        key = []
+        for h, a, need in zip(have, avail, self.rules.need):
+            if h >= need:
+                key.append((need, 0))
+            elif h + a < need:
+                key.append((0, 0))
+            else:
+                key.append((h, min(a, need - h)))
+        return tuple(key)
+
+    def _best_next(self, mask, unowned):
+        # この局面で次に1つ取るときのいちばん大きい価値（切り詰めた数ごとに覚えておく）
+        key = self._key(*self._counts(mask, unowned))
+        value = self._memo.get(key)
+        if value is not None:
+            self.memo_hits += 1
+            return value
+        self.memo_misses += 1
+        have = [h for h, _ in key]
+        avail = [a for _, a in key]
+        value = 0.0
+        for rule_ids, _ in self._groups:
+            value = max(value, self._gain_of(rule_ids, have, avail))
+        if len(self._memo) >= MEMO_SIZE:
+            self._memo.clear()
+        self._memo[key] = value
+        return value
+
+    def _check(self, deadline):
+        if time.perf_counter() > deadline:
+            self.over_budget += 1
+
+    # --- 判断 ---
+    def choose_stamp(self, game, player, candidates=None):
+        # まだ誰も持っていないスタンプから1つ選ぶ（候補がなければ None）
+        deadline = time.perf_counter() + self.budget
+        stamps = game.stamps
+        index = self.rules.index
+        unowned = stamps.unowned_mask()
+        candidates = stamps.unowned() if candidates is None else [s for s in candidates if s in index]
+        if not candidates:
+            return None
+        mask = stamps.mask_of(player)
+        have, avail = self._counts(mask, unowned)
+        others = [self._counts(stamps.mask_of(p), unowned)[0] for p in game.players if p != player]
+
+        # 1手だけ読んで並べる。ボーナスの組み合わせが同じ駅は1手目も次の手も同じ値なので、
+        # グループごとに最初の候補だけを読む。ここでも持ち時間が切れたら残りのグループは読まない
+        groups = {}
+        for s in candidates:
+            groups.setdefault(tuple(self.rules.rules_of[index[s]]), s)
+        first = {}
+        for rule_ids, s in groups.items():
+            first[s] = self._gain_of(rule_ids, have, avail) + DENY * max(
+                (self._loss_of(rule_ids, h, avail) for h in others), default=0.0)
+            if time.perf_counter() > deadline:
+                break
+        order = sorted(first, key=first.get, reverse=True)
+
+        # 時間の許す限り、上位から次の自分の手まで読む（1つ読むのにかかった時間が
+        # 残っていなければそこでやめる）
+        best, best_value = order[0], None
+        cost = 0.0
+        for s in order:
+            now = time.perf_counter()
+            if best_value is not None and now + cost > deadline:
+                break
+            bit = 1 << index[s]
+            value = first[s] + LOOKAHEAD * self._best_next(mask | bit, unowned & ~bit)
+            cost = time.perf_counter() - now
+            if best_value is None or value > best_value:
+                best, best_value = s, value
+        self._check(deadline)
+        return best
+
+    def choose_victim(self, game, player):
+        # 思い出の共有: (誰から, どのスタンプ) を選ぶ（誰も持っていなければ None）
+        deadline = time.perf_counter() + self.budget
+        stamps = game.stamps
+        index = self.rules.index
+        unowned = stamps.unowned_mask()
+        have, avail = self._counts(stamps.mask_of(player), unowned)
+        best, best_value = None, None
+        for other in game.players:
+            if other == player or not stamps.count(other):
+                continue
+            their_have = self._counts(stamps.mask_of(other), unowned)[0]
+            for s in stamps.stamps_of(other):
+                i = index[s]
+                value = self._gain(i, have, avail, from_unowned=False) + DENY * self._loss(i, their_have, avail, from_owner=True)
+                if best_value is None or value > best_value:
+                    best, best_value = (other, s), value
+            if time.perf_counter() > deadline:
+                break
+        self._check(deadline)
+        return best
+
+    def choose_destination(self, game, player):
+        # 路線図の進む先: 止まる駅のスタンプが取れるか、通る駅に取れるスタンプが多いほど良い
+        choices = game.destinations(player)
+        if not choices:
+            return None
+        stamps = game.stamps
+        index = self.rules.index
+        unowned = stamps.unowned_mask()
+        have, avail = self._counts(stamps.mask_of(player), unowned)
+
+        def value(item):
+            destination, path = item
+            free = [index[s] for s in path if s in index and (unowned >> index[s]) & 1]
+            landing = self._gain(index[destination], have, avail) if index.get(destination) in free else 0.0
+            return landing + 0.2 * sum(self._gain(i, have, avail) for i in free)
+
+        return max(choices.items(), key=value)[0]
+
+    def choose_card(self, game, player):
+        # 今使うカードの手札の位置（使わないなら None）
+        stamps = game.stamps
+        cards = game.cards_of(player)
+        unowned_passed = any(s in stamps and stamps.owner_of(s) is None for s in game.passed)
+        others_have = any(stamps.count(p) for p in game.players if p != player)
+        wanted = [
+            ("幻のスタンプ帳", unowned_passed),
+            ("思い出の共有", others_have),
+            (STAMP_CARDS[0], stamps.unowned_count() > 0),
+            (STAMP_CARDS[1], stamps.unowned_count() > 0),
+            (MOVE_CARDS[0], not game.pending_steps),
+            (MOVE_CARDS[1], not game.pending_steps),
+            (MUST_USE_CARDS[0], True),
+            (MUST_USE_CARDS[1], True),
+        ]
+        for name, ok in wanted:
+            if not ok:
+                continue
+            for slot, card in enumerate(cards):
+                if card["name"] == name:
+                    return slot
+        return None
+
+# ==========================================
+# 1ターン分の自動操作
+# ==========================================
+def play_turn(game, act, policy, load=None):
+    # ボットの1ターン（サイコロ → 移動 → スタンプかカード → カードを使う → 交代）。
+    # 操作はすべて act（GameStore.act など、操作ログに残る関数）を通す。
+    # load を渡すと操作のたびにゲームを取り直す（ストアが読み直したゲームでも最新の手札を見る）。
+    # act が None を返したら（操作が断られたら）、そこでこのターンの自動操作をやめる
+    player = game.current_player
+
+    def do(*action):
+        nonlocal game
+        if act(*action) is None:
+            return False
+        if load is not None:
+            game = load()
+        return True
+
+    def travel():
+        destination = policy.choose_destination(game, player)
+        return destination is None or do("travel", player, destination)
+
+    if not do("roll") or not travel():
+        return
+    landed = game.positions[player]
+    if landed in game.stamps and game.stamps.owner_of(landed) is None:
+        ok = do("get", landed, player)
+    else:
+        ok = do("draw", player)
+    if not ok:
+        return
+
+    while True:
+        slot = policy.choose_card(game, player)
+        if slot is None:
+            break
+        name = game.cards_of(player)[slot]["name"]
+        if not do("use", player, slot, game.player_cards[player][slot]):
+            return
+        if name == "思い出の共有":
+            victim = policy.choose_victim(game, player)
+            ok = victim is None or do("move", victim[1], victim[0], player)
+        elif name in STAMP_CARDS:
+            station = policy.choose_stamp(game, player)
+            ok = station is None or do("get", station, player)
+        elif name in MOVE_CARDS:
+            ok = travel()
+        else:
+            ok = True
+        if not ok:
+            return
+
+    # 人間のプレイヤーが全員ゴールしたら、ボットもゴールして終わらせる
+    humans = [p for p in game.players if p not in game.bots]
+    if humans and all(p in game.finished_players for p in humans):
+        do("goal", player)
+    else:
+        do("next")
+
+_policies = {}
+
+def get_policy(rules):
+    # ルールごとに1つ（覚えた局面を全ゲームで使い回す）
+    policy = _policies.get(id(rules))
+    if policy is None or policy.rules is not rules:
+        policy = _policies[id(rules)] = BotPolicy(rules)
+    return policy
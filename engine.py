@@ -0,0 +1,1125 @@
+# ==========================================
+# 新幹線すごろく ゲームエンジン
+# Streamlit に依存しないゲームロジック（app.py とシミュレーターの両方から使う）
+# ==========================================
+import array
+import functools
+import math
+import random
+import sys
+
+import board
+import metrics
+import quiz_store
+
+# ==========================================
+# ボーナスルールの定義
+# ==========================================
+BONUS_RULES = [
+    {
+        "name": "🐮 北海道新幹線好き",
+        "stations": ["札幌", "新小樽", "倶知安", "長万部", "新八雲", "新函館北斗", "木古内", "奥津軽いまべつ", "新青森"],
+        "type": "any", "threshold": 5, "points": 5
+    },
+    {
+        "name": "👹 秋田新幹線好き",
+        "stations": ["秋田", "大曲", "角館", "田沢湖", "雫石", "盛岡"],
+        "type": "any", "threshold": 5, "points": 5
+    },
+    {
+        "name": "🍒 山形新幹線好き",
+        "stations": ["新庄", "大石田", "村山", "さくらんぼ東根", "天童", "山形", "かみのやま温泉", "赤湯", "高畠", "米沢", "福島"],
+        "type": "any", "threshold": 5, "points": 5
+    },
+    {
+        "name": "🚄 東北新幹線好き",
+        "stations": ["新青森", "七戸十和田", "八戸", "二戸", "いわて沼宮内", "盛岡", "新花巻", "北上", "水沢江刺", "一ノ関", "くりこま高原", "古川", "仙台", "白石蔵王", "福島", "郡山", "新白河", "那須塩原", "宇都宮", "小山"],
+        "type": "any", "threshold": 5, "points": 5
+    },
+    {
+        "name": "🌾 上越新幹線好き",
+        "stations": ["大宮", "高崎", "上毛高原", "越後湯沢", "浦佐", "長岡", "燕三条", "新潟"],
+        "type": "any", "threshold": 5, "points": 5
+    },
+    {
+        "name": "🦀 北陸新幹線好き",
+        "stations": ["安中榛名", "軽井沢", "佐久平", "上田", "長野", "飯山", "上越妙高", "糸魚川", "黒部宇奈月温泉", "富山", "新高岡", "金沢", "小松", "加賀温泉", "福井", "芦原温泉", "越前たけふ", "敦賀"],
+        "type": "any", "threshold": 5, "points": 5
+    },
+    {
+        "name": "🗻 東海道新幹線好き",
+        "stations": ["新大阪", "京都", "米原", "岐阜羽島", "名古屋", "三河安城", "豊橋", "浜松", "掛川", "静岡", "新富士", "三島", "熱海", "小田原", "新横浜", "品川", "東京"],
+        "type": "any", "threshold": 5, "points": 5
+    },
+    {
+        "name": "🍑 山陽新幹線好き",
+        "stations": ["新神戸", "西明石", "姫路", "相生", "岡山", "新倉敷", "福山", "新尾道", "三原", "東広島", "広島", "新岩国", "徳山", "新山口", "厚狭", "新下関", "小倉"],
+        "type": "any", "threshold": 5, "points": 5
+    },
+    {
+        "name": "🕊️ 西九州新幹線好き",
+        "stations": ["新鳥栖", "武雄温泉", "嬉野温泉", "新大村", "諫早", "長崎"],
+        "type": "any", "threshold": 5, "points": 5
+    },
+    {
+        "name": "🐻 九州新幹線好き",
+        "stations": ["博多", "新鳥栖", "久留米", "筑後船小屋", "新大牟田", "新玉名", "熊本", "新八代", "新水俣", "出水", "川内", "鹿児島中央"],
+        "type": "any", "threshold": 5, "points": 5
+    },
+    {
+        "name": "🍊 四国制覇",
+        "stations": ["松山", "高知", "高松", "徳島"],
+        "type": "all", "points": 3
+    },
+    {
+        "name": "♨️ 温泉制覇",
+        "stations": ["かみのやま温泉", "黒部宇奈月温泉", "加賀温泉", "芦原温泉", "嬉野温泉", "武雄温泉"],
+        "type": "all", "points": 7
+    },
+    {
+        "name": "⛰️ 「山」がつく駅制覇",
+        "stations": ["村山", "山形", "郡山", "小山", "飯山", "富山", "岡山", "福山", "徳山", "新山口", "松山"],
+        "type": "all", "points": 10
+    },
+    {
+        "name": "🏙️ 大都市制覇",
+        "stations": ["東京", "新大阪", "名古屋"],
+        "type": "all", "points": 3
+    },
+    {
+        "name": "🏁 スタートとゴール",
+        "stations": ["札幌", "東京"],
+        "type": "all", "points": 5
+    }
+]
+
+EVENT_DECK_DATA = [
+    {"name": "追加乗車＋", "weight": 15, "desc": "今日はもう少し進もう！\n**サイコロを振って出た目の数だけ進む。**"},
+    {"name": "追加乗車ー", "weight": 15, "desc": "今日は少し戻ってみよう...\n**1〜3の好きな数だけ戻る。**"},
+    {"name": "お土産の誘惑", "weight": 15, "desc": "お土産を見てたら乗り遅れた！\n**【1回休み】になる。**"},
+    {"name": "旅の思い出",   "weight": 15, "desc": "窓から見える景色も思い出。\n**まだ誰も持っていないスタンプを1つゲットできる！**"},
+    {"name": "思い出の共有", "weight": 15, "desc": "他の人の思い出を聞こう。\n**他の人を一人選んで、スタンプを1つもらう。**"},
+    {"name": "博識（はくしき）", "weight": 10, "desc": "日本のことなら何でも知ってるぞ！\n**クイズの正解・不正解に関わらず、スタンプをゲット！**"},
+    {"name": "新幹線乗り換え", "weight": 10, "desc": "速い新幹線に乗り換えだ！\n**もう一度サイコロを振って、出た目 × 2マス進む。**"},
+    {"name": "幻のスタンプ帳", "weight": 5,  "desc": "すごいアイテムだ！\n**このターンに通ったマスのスタンプを全部ゲットできる！**"}
+]
+
+# 盤面の路線（「〇〇新幹線好き」の駅の並び）
+BOARD_LINES = tuple(tuple(rule["stations"]) for rule in BONUS_RULES if rule["name"].endswith("新幹線好き"))
+
+# ==========================================
+# 関数
+# ==========================================
+def get_board():
+    return board.build_board(BOARD_LINES)
+
+def load_stations(path=quiz_store.DEFAULT_PATH):
+    # クイズデータに出てくる駅名を出現順（重複なし）で返す
+    return quiz_store.load(path).stations
+
+@metrics.instrument("calculate_score")
+def calculate_score(player_name, stamp_owners):
+    my_stamps = [s for s, owner in stamp_owners.items() if owner == player_name]
+    rules = compile_rules(tuple(stamp_owners))
+    return rules.score_mask(rules.mask_of(my_stamps))
+
+def stations_of_mask(stations, mask):
+    # ビットマスクの立っている駅を駅の並び順で返す（立っているビットの数だけ回る）
+    result = []
+    while mask:
+        low = mask & -mask
+        result.append(stations[low.bit_length() - 1])
+        mask ^= low
+    return result
+
+# ==========================================
+# ボーナスルールのビットマスク化
+# ==========================================
+class CompiledRules:
+    # 駅の並び（クイズデータの出現順）を固定して、各ルールを「駅番号のビットマスク」に変換しておく。
+    # 1人分の得点は AND と popcount だけで、たくさんの盤面はまとめて行列計算で出せる
+    def __init__(self, stations, rules=BONUS_RULES):
+        self.stations = tuple(stations)
+        self.index = {s: i for i, s in enumerate(self.stations)}
+        self.rules = rules
+        self.masks = []
+        self.need = []
+        self.points = []
+        for rule in rules:
+            targets = set(rule["stations"])
+            self.masks.append(self.mask_of(s for s in targets if s in self.index))
+            # "all" は rule["stations"] の全駅が必要（駅データにない駅があれば達成不可）
+            self.need.append(rule["threshold"] if rule["type"] == "any" else len(targets))
+            self.points.append(rule["points"])
+        # 駅 → その駅が入っているルール番号（逆引き）
+        self.rules_of = [[] for _ in self.stations]
+        for r, rule_mask in enumerate(self.masks):
+            for s in self.stations_of(rule_mask):
+                self.rules_of[self.index[s]].append(r)
+        self._arrays = None
+
+    def mask_of(self, stamps):
+        mask = 0
+        for s in stamps:
+            mask |= 1 << self.index[s]
+        return mask
+
+    def stations_of(self, mask):
+        return stations_of_mask(self.stations, mask)
+
+    def score_mask(self, mask):
+        # 1人分の得点と内訳（結果発表の "details" と同じ形）
+        base_score = mask.bit_count()
+        total_score = base_score
+        details = [{"name": "🎫 スタンプ数", "points": base_score, "matched_stations": self.stations_of(mask)}]
+        for rule, rule_mask, need, points in zip(self.rules, self.masks, self.need, self.points):
+            matched = mask & rule_mask
+            if matched.bit_count() >= need:
+                total_score += points
+                details.append({
+                    "name": rule["name"],
+                    "points": points,
+                    "matched_stations": self.stations_of(matched)
+                })
+        return total_score, details
+
+    def arrays(self):
+        # ルール × 駅 の 0/1 行列と、必要枚数・点数のベクトル（numpy はここで初めて読み込む）
+        if self._arrays is None:
+            import numpy as np
+            matrix = np.zeros((len(self.rules), len(self.stations)), dtype=np.int16)
+            for r, rule_mask in enumerate(self.masks):
+                for s in self.stations_of(rule_mask):
+                    matrix[r, self.index[s]] = 1
+            self._arrays = (matrix, np.array(self.need, dtype=np.int16), np.array(self.points, dtype=np.int32))
+        return self._arrays
+
+    def score_many(self, owned, details=False):
+        # owned: (..., 駅数) の 0/1 配列（プレイヤー × 盤面 など、先頭の次元は自由）
+        # 戻り値: 得点 (...)、ボーナス達成 (..., ルール数)、details=True なら内訳も同じ形のリストで
+        import numpy as np
+        matrix, need, points = self.arrays()
+        owned = np.asarray(owned, dtype=bool)
+        hits = owned.astype(np.int16) @ matrix.T >= need
+        totals = owned.sum(axis=-1) + hits.astype(np.int32) @ points
+        if not details:
+            return totals, hits
+        breakdown = np.empty(totals.shape, dtype=object)
+        for pos in np.ndindex(totals.shape):
+            mask = self.mask_of(self.stations[i] for i in np.flatnonzero(owned[pos]))
+            breakdown[pos] = self.score_mask(mask)[1]
+        return totals, hits, breakdown.tolist()
+
+@functools.lru_cache(maxsize=8)
+def compile_rules(stations):
+    # 同じ駅の並びに対するコンパイル結果はプロセス内で使い回す
+    return CompiledRules(stations)
+
+# ==========================================
+# スタンプ台帳
+# ==========================================
+class StampLedger:
+    # 持ち主→スタンプ（駅番号のビットマスク）と誰も持っていない駅 を
+    # ゲット/移動/戻す のたびに同時に更新する。画面からは全駅を走査せずに読める。
+    # 駅の並びと駅→番号の辞書は CompiledRules のものを全セッションで共有する
+    __slots__ = ("stations", "index", "_masks", "_counts", "_unowned")
+
+    def __init__(self, stations, players, index=None):
+        self.stations = tuple(stations)
+        self.index = {s: i for i, s in enumerate(self.stations)} if index is None else index
+        self._masks = {p: 0 for p in players}
+        self._counts = {p: 0 for p in players}
+        self._unowned = (1 << len(self.stations)) - 1
+
+    def __contains__(self, station):
+        return station in self.index
+
+    def owner_of(self, station):
+        bit = 1 << self.index[station]
+        for player, mask in self._masks.items():
+            if mask & bit:
+                return player
+        return None
+
+    def owners(self):
+        # 駅→持ち主 の辞書（集計・互換用。毎回作り直す）
+        owners = dict.fromkeys(self.stations)
+        for player in self._masks:
+            for s in self.stamps_of(player):
+                owners[s] = player
+        return owners
+
+    def mask_of(self, player):
+        return self._masks.get(player, 0)
+
+    def count(self, player):
+        return self._counts.get(player, 0)
+
+    def counts(self):
+        return dict(self._counts)
+
+    def stamps_of(self, player):
+        return stations_of_mask(self.stations, self.mask_of(player))
+
+    def unowned(self):
+        return stations_of_mask(self.stations, self._unowned)
+
+    def unowned_mask(self):
+        return self._unowned
+
+    def unowned_count(self):
+        return len(self.stations) - sum(self._counts.values())
+
+    def set_owner(self, station, player):
+        # 持ち主を player（None なら誰のものでもない）に変えて、前の持ち主を返す
+        bit = 1 << self.index[station]
+        previous = self.owner_of(station)
+        if previous is None:
+            self._unowned &= ~bit
+        else:
+            self._masks[previous] &= ~bit
+            self._counts[previous] -= 1
+        if player is None:
+            self._unowned |= bit
+        else:
+            self._masks[player] |= bit
+            self._counts[player] += 1
+        return previous
+
+# ==========================================
+# 途中経過の得点
+# ==========================================
+class LiveScores:
+    # スタンプが動くたびに、その駅が入っているルールだけを見て各プレイヤーの
+    # 合計点とルールごとの進み具合（例: 東北新幹線好き 3/5）を更新する
+    __slots__ = ("rules", "_progress", "_totals")
+
+    def __init__(self, rules, players):
+        self.rules = rules
+        self._progress = {p: [0] * len(rules.masks) for p in players}
+        self._totals = {p: 0 for p in players}
+
+    def update(self, station, previous, player):
+        i = self.rules.index.get(station)
+        if previous is not None:
+            self._add(previous, i, -1)
+        if player is not None:
+            self._add(player, i, 1)
+
+    def _add(self, player, i, sign):
+        progress = self._progress[player]
+        self._totals[player] += sign
+        if i is None:
+            return
+        for r in self.rules.rules_of[i]:
+            need = self.rules.need[r]
+            before = progress[r] >= need
+            progress[r] += sign
+            after = progress[r] >= need
+            if before != after:
+                self._totals[player] += self.rules.points[r] * (after - before)
+
+    def total(self, player):
+        return self._totals[player]
+
+    def totals(self):
+        return dict(self._totals)
+
+    def progress(self, player):
+        # (ルール名, 今の枚数, 必要枚数, 達成済みか) のリスト
+        return [
+            (rule["name"], count, need, count >= need)
+            for rule, count, need in zip(self.rules.rules, self._progress[player], self.rules.need)
+        ]
+
+    def near_misses(self, player, within=1):
+        # あと within 枚以内で達成できるボーナス（駅データにない駅が必要なルールは除く）
+        result = []
+        for r, count in enumerate(self._progress[player]):
+            need = self.rules.need[r]
+            if count and 0 < need - count <= within and need <= self.rules.masks[r].bit_count():
+                result.append((self.rules.rules[r]["name"], count, need))
+        return result
+
+# ==========================================
+# クイズの出題順
+# ==========================================
+class QuizDeck:
+    # 1ゲーム分の出題順。問題番号をシャッフルした並びをカーソルで1問ずつめくるので、
+    # 1回の出題は O(1)、メモリは問題数ぶんで一定。全問出し切ったら並べ直す。
+    # シャッフルにはゲームの "quiz" の乱数列を使う（CardDeck と同じく引くときに渡す）
+    __slots__ = ("num_questions", "rounds", "_rng", "_order", "_cursor")
+
+    def __init__(self, num_questions, rng):
+        self.num_questions = num_questions
+        self.rounds = 0
+        self._rng = None
+        self._order = array.array("I", range(num_questions))
+        rng.shuffle(self._order)
+        self._cursor = 0
+
+    def remaining(self):
+        return self.num_questions - self._cursor
+
+    def draw(self, rng, asked=0):
+        # (問題番号, 並べ直したか) を返す。asked（出題済みのビットマスク）の問題は飛ばし、
+        # 最後までめくったら並べ直す（そのときは全問出題済みなので、出題済みを空に戻す）
+        rng = self._rng or rng
+        while self._cursor < self.num_questions and asked >> self._order[self._cursor] & 1:
+            self._cursor += 1
+        reset = False
+        if self._cursor >= self.num_questions:
+            rng.shuffle(self._order)
+            self._cursor = 0
+            self.rounds += 1
+            reset = True
+        chosen_index = self._order[self._cursor]
+        self._cursor += 1
+        return chosen_index, reset
+
+    def to_dict(self):
+        data = {"num_questions": self.num_questions, "rounds": self.rounds, "cursor": self._cursor,
+                "order": self._order.tolist()}
+        if self._rng is not None:
+            data["rng"] = rng_state(self._rng)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        deck = cls.__new__(cls)
+        deck.num_questions = data["num_questions"]
+        deck.rounds = data["rounds"]
+        deck._cursor = data["cursor"]
+        deck._order = array.array("I", data["order"])
+        # 山札が自分の乱数列を持っていたころのゲームは、その乱数列を使い続ける
+        deck._rng = restore_rng(data["rng"]) if "rng" in data else None
+        return deck
+
+# ==========================================
+# 難易度つきの出題
+# ==========================================
+# 出題のしかた → 画面に出す名前
+QUIZ_MODES = {
+    "random": "ランダム",
+    "hard": "むずかしい問題（一発逆転バトル用）",
+    "matched": "実力に合わせる",
+}
+MATCH_LEVELS = 10   # 「実力に合わせる」で正答率を何段階に分けるか
+
+class FenwickSampler:
+    # 重みに比例した確率で番号を選ぶ。Fenwick 木（部分和の木）で持つので、
+    # 1回の抽選も1つの重みの更新も O(log n)。作るのは最初の1回だけ O(n)
+    __slots__ = ("size", "_weights", "_tree", "_top")
+
+    def __init__(self, weights):
+        self.size = len(weights)
+        self._weights = array.array("d", weights)
+        self._tree = array.array("d", [0.0]) * (self.size + 1)
+        tree = self._tree
+        for i, w in enumerate(self._weights, 1):
+            tree[i] += w
+            parent = i + (i & -i)
+            if parent <= self.size:
+                tree[parent] += tree[i]
+        self._top = 1 << (self.size.bit_length() - 1) if self.size else 0
+
+    def weight(self, index):
+        return self._weights[index]
+
+    def total(self):
+        total = 0.0
+        i = self.size
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def update(self, index, weight):
+        delta = weight - self._weights[index]
+        self._weights[index] = weight
+        i = index + 1
+        while i <= self.size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def find(self, value):
+        # 累積の重みが value を超える最初の番号
+        pos = 0
+        step = self._top
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self._tree[nxt] <= value:
+                value -= self._tree[nxt]
+                pos = nxt
+            step >>= 1
+        return min(pos, self.size - 1)
+
+    def sample(self, u):
+        # u（0 以上 1 未満の一様乱数）で1つ選ぶ（重みが全部 0 なら None）。
+        # 選んだものを次から外すときは update(i, 0.0) する（O(log n)）
+        total = self.total()
+        if total <= 0:
+            return None
+        index = self.find(u * total)
+        if self._weights[index] <= 0:
+            # 浮動小数点の誤差で重み 0 の番号に当たったときは近くの番号にずらす
+            index = next((i for i in range(index, -1, -1) if self._weights[i] > 0), None)
+            if index is None:
+                index = next((i for i in range(self.size) if self._weights[i] > 0), None)
+        return index
+
+def difficulty(correct, wrong):
+    # 不正解の割合（まだ誰も答えていない問題は 0.5）
+    return (wrong + 1) / (correct + wrong + 2)
+
+def hit_rate(correct, total):
+    return (correct + 1) / (total + 2)
+
+def mode_weight(mode, correct, wrong, level=None):
+    d = difficulty(correct, wrong)
+    if mode == "hard":
+        return d ** 3
+    if mode == "matched":
+        # 正答率の高い人ほどむずかしい問題が出やすくなる
+        target = level / MATCH_LEVELS
+        return 0.02 + (1.0 - abs(d - target)) ** 4
+    return 1.0
+
+class QuestionPicker:
+    # 問題集1つ分の正解・不正解の数（全ゲームで共有）。
+    # 抽選器はゲームごとに Game が作る（ゲームの途中で記録された答えは次のゲームから重みに入る）
+    def __init__(self, keys, stats=None):
+        stats = stats or {}
+        self.keys = list(keys)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.correct = array.array("I", (stats.get(k, (0, 0))[0] for k in self.keys))
+        self.wrong = array.array("I", (stats.get(k, (0, 0))[1] for k in self.keys))
+
+    def weights(self, mode, level=None):
+        return [mode_weight(mode, c, w, level) for c, w in zip(self.correct, self.wrong)]
+
+    def record(self, key, correct, count=1):
+        # 答えを count 回分足す（取り消すときは count=-1）
+        i = self.index.get(key)
+        if i is None:
+            return
+        if correct:
+            self.correct[i] = max(self.correct[i] + count, 0)
+        else:
+            self.wrong[i] = max(self.wrong[i] + count, 0)
+
+# ==========================================
+# イベントカードの抽選
+# ==========================================
+class AliasTable:
+    # 重みつきの抽選を O(1) で行う表（Walker の別名法）。作るのは重みが変わったときだけ O(n)
+    __slots__ = ("size", "prob", "alias")
+
+    def __init__(self, weights):
+        n = len(weights)
+        total = float(sum(weights))
+        scaled = [w * n / total for w in weights]
+        self.size = n
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            g = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = g
+            scaled[g] -= 1.0 - scaled[s]
+            (small if scaled[g] < 1.0 else large).append(g)
+        # 残りは誤差で 1.0 からずれているだけなので、そのまま選ばれるようにする
+
+    def sample(self, rng):
+        # 乱数1回で1つ選ぶ
+        u = rng.random() * self.size
+        i = int(u)
+        return i if u - i < self.prob[i] else self.alias[i]
+
+    def sample_many(self, rng, size):
+        # numpy の Generator でまとめて選ぶ（シミュレーターや分析用）
+        import numpy as np
+        u = rng.random(size) * self.size
+        i = u.astype(np.int64)
+        return np.where(u - i < np.asarray(self.prob)[i], i, np.asarray(self.alias)[i])
+
+@functools.lru_cache(maxsize=8)
+def compile_deck(weights):
+    # 重みの並びごとに1回だけ表を作る
+    return AliasTable(weights)
+
+def deck_copies(weights):
+    # 山札を使うときの各カードの枚数（重みを最大公約数で割ったもの）
+    g = functools.reduce(math.gcd, weights)
+    return [w // g for w in weights]
+
+class CardDeck:
+    # 山札（有限のデッキ）。重みの比の枚数だけカードを入れてシャッフルし、
+    # 上から1枚ずつ引く。なくなったら全部戻してシャッフルし直す
+    __slots__ = ("rounds", "_order", "_cursor")
+
+    def __init__(self, weights, rng):
+        self.rounds = 0
+        self._order = array.array("H", (card_id for card_id, n in enumerate(deck_copies(weights)) for _ in range(n)))
+        rng.shuffle(self._order)
+        self._cursor = 0
+
+    def remaining(self):
+        return len(self._order) - self._cursor
+
+    def draw(self, rng):
+        if self._cursor >= len(self._order):
+            rng.shuffle(self._order)
+            self._cursor = 0
+            self.rounds += 1
+        card_id = self._order[self._cursor]
+        self._cursor += 1
+        return card_id
+
+    def to_dict(self):
+        return {"rounds": self.rounds, "cursor": self._cursor, "order": self._order.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        deck = cls.__new__(cls)
+        deck.rounds = data["rounds"]
+        deck._cursor = data["cursor"]
+        deck._order = array.array("H", data["order"])
+        return deck
+
+# ==========================================
+# 保存用の変換
+# ==========================================
+def rng_state(rng):
+    # random.Random の内部状態を JSON にできる形で返す
+    version, internal, gauss = rng.getstate()
+    return [version, list(internal), gauss]
+
+# 用途ごとに別々の乱数列を使う（サイコロを1回多く振っても、カードや出題順は変わらない）
+RNG_STREAMS = ("dice", "cards", "quiz")
+
+def stream_rng(seed, purpose):
+    # ゲームのシードと用途から決まる乱数列（文字列のシードは実行ごとに変わらない）
+    return random.Random(f"{seed}/{purpose}")
+
+def restore_rng(state):
+    rng = random.Random()
+    version, internal, gauss = state
+    rng.setstate((version, tuple(internal), gauss))
+    return rng
+
+# ==========================================
+# メモリ計測
+# ==========================================
+def _shared_ids():
+    # 全セッションで共有しているデータ（セッションごとのメモリには数えない）
+    shared = {id(BONUS_RULES), id(EVENT_DECK_DATA), id(None), id(True), id(False)}
+    shared.update(id(card) for card in EVENT_DECK_DATA)
+    return shared
+
+def deep_sizeof(obj, shared=None, _seen=None):
+    # obj からたどれるオブジェクトの合計バイト数（同じオブジェクトは1回だけ数える）
+    seen = set(shared or ()) if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, None, seen) + deep_sizeof(v, None, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, None, seen) for item in obj)
+    elif isinstance(obj, (str, bytes, int, float, array.array)):
+        pass
+    else:
+        for name in getattr(type(obj), "__slots__", ()):
+            if hasattr(obj, name):
+                size += deep_sizeof(getattr(obj, name), None, seen)
+        if hasattr(obj, "__dict__"):
+            size += deep_sizeof(vars(obj), None, seen)
+    return size
+
+# ==========================================
+# 操作ログ
+# ==========================================
+# 操作の種類 → 入力の数（それより後ろは apply が付け足した結果）
+ACTION_ARITY = {
+    "roll": 0,      # ("roll", 出た目)
+    "quiz": 1,      # ("quiz", 問題数, 問題番号, 並べ直したか)
+    "station_quiz": 3,  # ("station_quiz", 駅, その駅の問題番号, 問題数, 問題番号, 並べ直したか, ランダムか)
+    "pick_quiz": 3,     # ("pick_quiz", 出題のしかた, 問題番号, 並べ直したか) 問題番号からは apply が決める
+    "answer": 3,    # ("answer", プレイヤー, 問題のキー, 正解したか)
+    "draw": 1,      # ("draw", プレイヤー, カード番号)
+    "use": 3,       # ("use", プレイヤー, 手札の位置, カード番号, カードの効果...)
+    "travel": 2,    # ("travel", プレイヤー, 着く駅, 通った駅)
+    "get": 2,       # ("get", 駅, プレイヤー)
+    "move": 3,      # ("move", 駅, 誰から, 誰へ)
+    "return": 1,    # ("return", 駅, 前の持ち主)
+    "goal": 1,      # ("goal", プレイヤー)
+    "next": 0,      # ("next",)
+    "end": 0,       # ("end",)
+}
+
+def describe_action(event):
+    # 操作ログの1件を画面に出す文章にする
+    kind = event[0]
+    if kind == "roll":
+        return f"🎲 サイコロ: {event[1]}"
+    if kind == "quiz":
+        return "❓ クイズを出題"
+    if kind == "station_quiz":
+        return f"❓ {event[1]}駅のクイズを出題"
+    if kind == "pick_quiz":
+        return f"❓ クイズを出題（{QUIZ_MODES.get(event[1], event[1])}）"
+    if kind == "answer":
+        return f"{'⭕' if event[3] else '❌'} {event[1]} が{'正解' if event[3] else '不正解'}"
+    if kind == "draw":
+        return f"🎒 {event[1]} が「{EVENT_DECK_DATA[event[2]]['name']}」を引いた"
+    if kind == "use":
+        return f"🎫 {event[1]} が「{EVENT_DECK_DATA[event[3]]['name']}」を使った"
+    if kind == "travel":
+        return f"🚄 {event[1]} が {event[2]} へ（{len(event[3])}駅）"
+    if kind == "get":
+        return f"📍 {event[2]} が「{event[1]}」をゲット"
+    if kind == "move":
+        return f"🎁 「{event[1]}」を {event[2]} から {event[3]} へ"
+    if kind == "return":
+        return f"↩️ {event[2]} の「{event[1]}」を戻した"
+    if kind == "goal":
+        return f"🏁 {event[1]} がゴール"
+    if kind == "next":
+        return "⏭️ 次のプレイヤーへ交代"
+    if kind == "end":
+        return "🛑 強制終了"
+    return kind
+
+# ==========================================
+# ゲーム本体
+# ==========================================
+class Game:
+    # 1ゲーム分の状態と操作。画面（Streamlit）からはこのメソッドだけを呼ぶ。
+    # セッションには小さな整数ID（問題番号・カード番号）だけを持たせ、
+    # 問題文やカードの説明は共有データから表示のたびに引く
+    __slots__ = (
+        "players", "current_player_idx", "finished_players", "game_ended",
+        "player_cards", "stamps", "rules", "scores", "dice_count", "dice_result",
+        "answers", "asked", "quiz_answered", "board", "positions", "passed", "pending_steps", "bots",
+        "current_quiz_idx", "quiz_deck", "card_deck", "seed", "rngs", "seq", "_samplers", "picker",
+    )
+
+    def __init__(self, players, stations, seed=None, finite_deck=False, bots=()):
+        self.players = list(players)
+        # コンピューターが操作するプレイヤー
+        self.bots = [p for p in self.players if p in bots]
+        self.current_player_idx = 0
+        self.finished_players = []
+        self.game_ended = False
+        self.player_cards = {name: [] for name in self.players}
+        self.rules = compile_rules(tuple(dict.fromkeys(stations)))
+        self.stamps = StampLedger(self.rules.stations, self.players, self.rules.index)
+        self.scores = LiveScores(self.rules, self.players)
+        self.dice_count = 0
+        self.dice_result = None
+        self.current_quiz_idx = None
+        self.quiz_deck = None
+        # プレイヤーごとの [正解数, 回答数] と、このゲームで出題した問題（問題番号のビットマスク）。
+        # 全問出し切ったら空に戻すので、問題数より大きくならない
+        self.answers = {name: [0, 0] for name in self.players}
+        self.asked = 0
+        # 出題のしかた → (実力の段階, このゲーム用の抽選器)。保存はせず、必要になったら作り直す
+        self._samplers = {}
+        # 重みつきの出題に使う問題集の QuestionPicker（保存はせず、出題の前にストアが渡す）
+        self.picker = None
+        self.quiz_answered = False
+        # 路線図の上の位置。passed はこのターンに通った駅、pending_steps はまだ進んでいないマス数
+        self.board = get_board()
+        self.positions = {name: board.START_STATION for name in self.players}
+        self.passed = []
+        self.pending_steps = 0
+        # シードを残しておけば同じ出題順・サイコロの目・カードを再現できる
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.rngs = {purpose: stream_rng(self.seed, purpose) for purpose in RNG_STREAMS}
+        # 山札を使うときだけ CardDeck（使わなければ毎回重みどおりに引く）
+        self.card_deck = CardDeck(self.card_weights(), self.rngs["cards"]) if finite_deck else None
+        # これまでに apply した操作の数（操作ログの通し番号）
+        self.seq = 0
+
+    @property
+    def current_player(self):
+        return self.players[self.current_player_idx]
+
+    # --- サイコロ ---
+    def roll_dice(self):
+        self.dice_count += 1
+        self.dice_result = self.rngs["dice"].randint(1, 6)
+        # カードでもらってまだ進んでいないマスがあれば、それに足す
+        self.pending_steps += self.dice_result
+        return self.dice_result
+
+    # --- 路線図の上の移動 ---
+    def destinations(self, player=None):
+        # 今のマス数で進める駅 → 通る駅
+        player = self.current_player if player is None else player
+        if not self.pending_steps or self.positions[player] not in self.board:
+            return {}
+        return self.board.destinations(self.positions[player], self.pending_steps)
+
+    def travel(self, player, destination):
+        # 残りのマス数だけ destination まで進む。通った駅を返す
+        if not self.pending_steps:
+            raise ValueError("進めるマスがありません")
+        path = self.board.passed(self.positions[player], self.pending_steps, destination)
+        if path is None:
+            raise ValueError(f"{destination} には進めません")
+        self.positions[player] = destination
+        self.passed.extend(path)
+        self.pending_steps = 0
+        return path
+
+    # --- クイズ ---
+    def draw_quiz(self, num_questions):
+        # 未出題の問題から1問選ぶ。全問出題済みならリセットして True を返す
+        if self.quiz_deck is None or self.quiz_deck.num_questions != num_questions:
+            self.quiz_deck = QuizDeck(num_questions, self.rngs["quiz"])
+        chosen_index, reset = self.quiz_deck.draw(self.rngs["quiz"], self.asked)
+        if reset:
+            self._reset_asked()
+        self._set_quiz(chosen_index)
+        return chosen_index, reset
+
+    def draw_station_quiz(self, station, question_ids, num_questions):
+        # 止まった駅の問題（question_ids）のうち、まだ出していないものから1問選ぶ。
+        # なければ（その駅の問題がない・全部出した）ランダムに出題する
+        fresh = [i for i in question_ids if not self.is_asked(i)]
+        if not fresh:
+            chosen_index, reset = self.draw_quiz(num_questions)
+            return chosen_index, reset, True
+        self._set_quiz(fresh[0] if len(fresh) == 1 else self.rngs["quiz"].choice(fresh))
+        return self.current_quiz_idx, False, False
+
+    def question_sampler(self, mode, picker):
+        # このゲーム用の抽選器（出題済みの問題は重み 0）。最初の1回だけ O(n) で作り、
+        # あとは出題のたびにその問題の重みを 0 にするだけ（O(log n)）
+        level = round(self.hit_rate(self.current_player) * MATCH_LEVELS) if mode == "matched" else None
+        cached = self._samplers.get(mode)
+        if cached is not None and cached[0] == level and cached[1].size == len(picker.keys):
+            return cached[1]
+        weights = picker.weights(mode, level)
+        rest = self.asked
+        while rest:
+            low = rest & -rest
+            if low.bit_length() <= len(weights):
+                weights[low.bit_length() - 1] = 0.0
+            rest ^= low
+        sampler = FenwickSampler(weights)
+        self._samplers[mode] = (level, sampler)
+        return sampler
+
+    def choose_question(self, mode, picker, u):
+        # (問題番号, 並べ直したか)。まだ出していない問題から重みに比例して選ぶ。
+        # 全問出し切っていたら、QuizDeck と同じように出題済みを空にして全体から選ぶ
+        index = self.question_sampler(mode, picker).sample(u)
+        if index is not None:
+            return index, False
+        level = self._samplers[mode][0]
+        return FenwickSampler(picker.weights(mode, level)).sample(u), True
+
+    def is_asked(self, question_idx):
+        return bool(self.asked >> question_idx & 1)
+
+    def _reset_asked(self):
+        self.asked = 0
+        self._samplers.clear()
+
+    def _set_quiz(self, question_idx):
+        self.current_quiz_idx = question_idx
+        self.asked |= 1 << question_idx
+        for _, sampler in self._samplers.values():
+            if question_idx < sampler.size:
+                sampler.update(question_idx, 0.0)
+        self.quiz_answered = False
+
+    def answer(self, player, correct):
+        # 今の問題の正解・不正解を記録する（1問につき1回まで）
+        if self.current_quiz_idx is None or self.quiz_answered:
+            raise ValueError("記録できる問題がありません")
+        self.answers[player][0] += bool(correct)
+        self.answers[player][1] += 1
+        self.quiz_answered = True
+
+    def hit_rate(self, player):
+        return hit_rate(*self.answers[player])
+
+    # --- イベントカード ---
+    # 手札は EVENT_DECK_DATA の番号で持つ
+    @staticmethod
+    def card_weights():
+        return tuple(card['weight'] for card in EVENT_DECK_DATA)
+
+    def draw_card(self, player=None):
+        player = self.current_player if player is None else player
+        if self.card_deck is not None:
+            card_id = self.card_deck.draw(self.rngs["cards"])
+        else:
+            card_id = compile_deck(self.card_weights()).sample(self.rngs["cards"])
+        self.player_cards[player].append(card_id)
+        return EVENT_DECK_DATA[card_id]
+
+    def cards_of(self, player):
+        return [EVENT_DECK_DATA[card_id] for card_id in self.player_cards[player]]
+
+    def use_card(self, player, slot):
+        card_id = self.player_cards[player].pop(slot)
+        self.resolve_card(player, card_id)
+        return EVENT_DECK_DATA[card_id]
+
+    def resolve_card(self, player, card_id):
+        # 盤面だけで決まるカードの効果をその場で処理して、結果をタプルで返す
+        name = EVENT_DECK_DATA[card_id]["name"]
+        if name in ("新幹線乗り換え", "追加乗車＋"):
+            roll = self.rngs["dice"].randint(1, 6)
+            self.dice_result = roll
+            # まだ進んでいないマスがあれば、それに足す
+            self.pending_steps += roll * 2 if name == "新幹線乗り換え" else roll
+            return (roll, self.pending_steps)
+        if name == "幻のスタンプ帳":
+            gained = [s for s in dict.fromkeys(self.passed) if s in self.stamps and self.stamps.owner_of(s) is None]
+            for station in gained:
+                self._set_owner(station, player)
+            return tuple(gained)
+        return ()
+
+    # --- スタンプ ---
+    @property
+    def stamp_owners(self):
+        return self.stamps.owners()
+
+    def stamps_of(self, player):
+        return self.stamps.stamps_of(player)
+
+    def available_stations(self):
+        return self.stamps.unowned()
+
+    def stamp_counts(self):
+        return self.stamps.counts()
+
+    def get_stamp(self, station, player=None):
+        player = self.current_player if player is None else player
+        if station not in self.stamps or self.stamps.owner_of(station) is not None:
+            raise ValueError(f"「{station}」のスタンプはゲットできません")
+        self._set_owner(station, player)
+
+    def move_stamp(self, station, from_player, to_player):
+        if from_player == to_player:
+            raise ValueError("自分には移動できません")
+        if station not in self.stamps or self.stamps.owner_of(station) != from_player:
+            raise ValueError("移動できるスタンプがありません")
+        self._set_owner(station, to_player)
+
+    def return_stamp(self, station):
+        if station not in self.stamps or self.stamps.owner_of(station) is None:
+            raise ValueError("戻せるスタンプがありません")
+        self._set_owner(station, None)
+
+    def _set_owner(self, station, player):
+        previous = self.stamps.set_owner(station, player)
+        self.scores.update(station, previous, player)
+
+    # --- ターン進行 ---
+    def finish(self, player=None):
+        player = self.current_player if player is None else player
+        if player not in self.finished_players:
+            self.finished_players.append(player)
+
+    def goal(self, player=None):
+        self.finish(player)
+        self.go_to_next_player()
+
+    @metrics.instrument("go_to_next_player")
+    def go_to_next_player(self):
+        if len(self.finished_players) >= len(self.players):
+            self.game_ended = True
+            return
+
+        current = self.current_player_idx
+        for _ in range(len(self.players)):
+            current = (current + 1) % len(self.players)
+            if self.players[current] not in self.finished_players:
+                self.current_player_idx = current
+                break
+
+        self.dice_result = None
+        self.current_quiz_idx = None
+        self.passed = []
+        self.pending_steps = 0
+
+    # --- 操作ログ ---
+    # 状態を変える操作はすべて apply を通す。操作は小さなタプル（JSON では配列）で、
+    # apply は結果（サイコロの目や引いたカードなど）を付け足したイベントを返す。
+    # 乱数はゲームの用途ごとの乱数列（rngs）から引くので、スナップショットから同じ順に apply し直せば
+    # 同じ結果になる（やり直しのときは ACTION_ARITY までの入力だけを使う）
+    def apply(self, action):
+        kind = action[0]
+        args = tuple(action[1:1 + ACTION_ARITY[kind]])
+        outcome = getattr(self, "_apply_" + kind)(*args)
+        self.seq += 1
+        return (kind,) + args + outcome
+
+    def _apply_roll(self):
+        return (self.roll_dice(),)
+
+    def _apply_quiz(self, num_questions):
+        return self.draw_quiz(num_questions)
+
+    def _apply_station_quiz(self, station, question_ids, num_questions):
+        return self.draw_station_quiz(station, question_ids, num_questions)
+
+    def _apply_pick_quiz(self, mode, question_idx=None, reset=False):
+        # 初めての出題では "quiz" の乱数列と picker の重みで問題を選び、結果をイベントに残す。
+        # やり直しのときはイベントの問題番号を使う（乱数列は同じだけ進める）
+        u = self.rngs["quiz"].random()
+        if question_idx is not None:
+            if reset:
+                self._reset_asked()
+            self._set_quiz(question_idx)
+            return ()
+        if self.picker is None:
+            raise ValueError("問題集が読み込まれていません")
+        question_idx, reset = self.choose_question(mode, self.picker, u)
+        if reset:
+            self._reset_asked()
+        self._set_quiz(question_idx)
+        return (question_idx, reset)
+
+    def _apply_answer(self, player, key, correct):
+        self.answer(player, correct)
+        return ()
+
+    def _apply_draw(self, player):
+        self.draw_card(player)
+        return (self.player_cards[player][-1],)
+
+    def _apply_use(self, player, slot, card_id):
+        # 画面が古いままのクリックで別のカードを使ってしまわないように、その位置のカードを確かめる
+        hand = self.player_cards[player]
+        if not 0 <= slot < len(hand) or hand[slot] != card_id:
+            raise ValueError("そのカードはもう手札にありません")
+        hand.pop(slot)
+        return self.resolve_card(player, card_id)
+
+    def _apply_travel(self, player, destination):
+        return (tuple(self.travel(player, destination)),)
+
+    def _apply_get(self, station, player):
+        self.get_stamp(station, player)
+        return ()
+
+    def _apply_move(self, station, from_player, to_player):
+        self.move_stamp(station, from_player, to_player)
+        return ()
+
+    def _apply_return(self, station):
+        previous = self.stamps.owner_of(station) if station in self.stamps else None
+        self.return_stamp(station)
+        return (previous,)
+
+    def _apply_goal(self, player):
+        self.goal(player)
+        return ()
+
+    def _apply_next(self):
+        self.go_to_next_player()
+        return ()
+
+    def _apply_end(self):
+        self.game_ended = True
+        return ()
+
+    # --- 保存・復元 ---
+    def to_dict(self):
+        # JSON にできる形（スタンプは駅名で持つので、駅の並びが変わっても復元できる）
+        return {
+            "players": self.players,
+            "stations": list(self.rules.stations),
+            "current_player_idx": self.current_player_idx,
+            "finished_players": self.finished_players,
+            "game_ended": self.game_ended,
+            "player_cards": self.player_cards,
+            "stamps": {p: self.stamps.stamps_of(p) for p in self.players},
+            "dice_count": self.dice_count,
+            "dice_result": self.dice_result,
+            "current_quiz_idx": self.current_quiz_idx,
+            "quiz_deck": self.quiz_deck.to_dict() if self.quiz_deck is not None else None,
+            "answers": self.answers,
+            "asked": format(self.asked, "x"),
+            "quiz_answered": self.quiz_answered,
+            "card_deck": self.card_deck.to_dict() if self.card_deck is not None else None,
+            "bots": self.bots,
+            "positions": self.positions,
+            "passed": self.passed,
+            "pending_steps": self.pending_steps,
+            "seed": self.seed,
+            "rngs": {purpose: rng_state(rng) for purpose, rng in self.rngs.items()},
+            "seq": self.seq,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        game = cls(data["players"], data["stations"], seed=data["seed"])
+        game.current_player_idx = data["current_player_idx"]
+        game.finished_players = list(data["finished_players"])
+        game.game_ended = data["game_ended"]
+        game.player_cards = {p: list(cards) for p, cards in data["player_cards"].items()}
+        for player, stamps in data["stamps"].items():
+            for station in stamps:
+                if station in game.stamps:
+                    game._set_owner(station, player)
+        game.dice_count = data["dice_count"]
+        game.dice_result = data["dice_result"]
+        game.current_quiz_idx = data["current_quiz_idx"]
+        if data["quiz_deck"] is not None:
+            game.quiz_deck = QuizDeck.from_dict(data["quiz_deck"])
+        game.answers = {p: list(a) for p, a in data.get("answers", game.answers).items()}
+        asked = data.get("asked", 0)
+        if isinstance(asked, str):
+            game.asked = int(asked, 16)
+        else:
+            # 出題済みを一覧で持っていたころのゲーム
+            for question_idx in asked:
+                game.asked |= 1 << question_idx
+        game.quiz_answered = data.get("quiz_answered", False)
+        game.bots = list(data.get("bots", ()))
+        game.positions.update(data.get("positions", {}))
+        game.passed = list(data.get("passed", ()))
+        game.pending_steps = data.get("pending_steps", 0)
+        if data.get("card_deck") is not None:
+            game.card_deck = CardDeck.from_dict(data["card_deck"])
+        if "rngs" in data:
+            game.rngs = {purpose: restore_rng(state) for purpose, state in data["rngs"].items()}
+        else:
+            # 乱数列を分ける前に保存されたゲームは、1本の乱数列を全部の用途で使い続ける
+            shared = restore_rng(data["rng"])
+            game.rngs = {purpose: shared for purpose in RNG_STREAMS}
+        game.seq = data.get("seq", 0)
+        return game
+
+    # --- メモリ ---
+    def memory_report(self):
+        # このゲームがセッションごとに持っているメモリ（共有データは数えない）
+        shared = _shared_ids()
+        shared.update((id(self.rules), id(self.rules.stations), id(self.rules.index), id(self.board), id(self.picker)))
+        report = {name: deep_sizeof(getattr(self, name), shared) for name in self.__slots__}
+        report["total"] = sys.getsizeof(self) + sum(report.values())
+        return report
+
+    # --- 結果 ---
+    @metrics.instrument("results")
+    def results(self):
+        results = []
+        for p in self.players:
+            score, details = self.rules.score_mask(self.stamps.mask_of(p))
+            results.append({"player": p, "score": score, "details": details})
+        results.sort(key=lambda x: x["score"], reverse=True)
+        return results
@@ -0,0 +1,167 @@
+# ==========================================
+# ゲームの記録（game_records.py のアーカイブ）の集計
+# イベントで遊ばれた全ゲームについて、
+#   ・どの駅のスタンプが早く取られるか（取られた割合・最初に取られた割合・平均の順番とターン）
+#   ・どのボーナスが実際に達成されているか（calculate_score と同じ CompiledRules で判定）
+#   ・ゲームの長さ（ターン数・ラウンド数）の分布
+# を出す。記録は1ゲームずつ読んで数えるだけなので、何十万ゲームあってもメモリは増えない。
+# ファイルが複数あればファイルごとに別のプロセスで集計してから合算する。
+#
+# 使い方:
+#   python game_analytics.py game_records.jsonl.gz
+#   python game_analytics.py day1.jsonl.gz day2.jsonl.gz --workers 4 --json report.json
+#   python game_analytics.py game_records.jsonl.gz --rules my_rules.json   （別のルールなら何人達成していたか）
+# ==========================================
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import game_records
+import quiz_store
+from engine import BONUS_RULES, CompiledRules, load_stations
+from simulator import hist_summary
+
+class Summary:
+    # 合算できる集計（駅の数・ルールの数・ゲームの長さの種類の分だけしか大きくならない）
+    def __init__(self, num_rules):
+        self.games = 0
+        self.player_games = 0
+        self.players = Counter()       # 人数 -> ゲーム数
+        self.turns = Counter()         # ターン数 -> ゲーム数
+        self.rounds = Counter()        # ラウンド数 -> ゲーム数
+        self.claimed = Counter()       # 駅 -> 取られたゲーム数
+        self.first = Counter()         # 駅 -> そのゲームで最初に取られたゲーム数
+        self.order_sum = Counter()     # 駅 -> 何番目に取られたかの合計
+        self.turn_sum = Counter()      # 駅 -> 何ターン目に取られたかの合計
+        self.rule_hits = [0] * num_rules
+
+    def add(self, record, rules):
+        num_players = len(record["players"])
+        turns = record["turns"]
+        self.games += 1
+        self.player_games += num_players
+        self.players[num_players] += 1
+        self.turns[turns] += 1
+        self.rounds[-(-turns // num_players)] += 1
+
+        seen = set()
+        for turn, station, _ in game_records.claims_of(record["actions"], num_players):
+            if station in seen:
+                continue
+            seen.add(station)
+            if len(seen) == 1:
+                self.first[station] += 1
+            self.claimed[station] += 1
+            self.order_sum[station] += len(seen)
+            self.turn_sum[station] += turn
+
+        for stamps in record["stamps"].values():
+            mask = rules.mask_of(s for s in stamps if s in rules.index)
+            for r, (rule_mask, need) in enumerate(zip(rules.masks, rules.need)):
+                if (mask & rule_mask).bit_count() >= need:
+                    self.rule_hits[r] += 1
+
+    def merge(self, other):
+        self.games += other.games
+        self.player_games += other.player_games
+        for name in ("players", "turns", "rounds", "claimed", "first", "order_sum", "turn_sum"):
+            getattr(self, name).update(getattr(other, name))
+        self.rule_hits = [a + b for a, b in zip(self.rule_hits, other.rule_hits)]
+        return self
+
+def summarize_file(path, stations, rules=BONUS_RULES):
+    # 1ファイル分の集計（ワーカーのプロセスで動く）
+    compiled = CompiledRules(stations, rules)
+    summary = Summary(len(rules))
+    for record in game_records.read(path):
+        summary.add(record, compiled)
+    return summary
+
+def _histogram(counter):
+    hist = np.zeros(max(counter) + 1, dtype=np.int64)
+    for value, count in counter.items():
+        hist[value] = count
+    return hist
+
+def analyze(paths, stations, rules=BONUS_RULES, workers=None):
+    if workers == 1 or len(paths) == 1:
+        parts = [summarize_file(path, stations, rules) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(summarize_file, paths, [stations] * len(paths), [rules] * len(paths)))
+    total = Summary(len(rules))
+    for part in parts:
+        total.merge(part)
+    if not total.games:
+        return {"files": len(paths), "games": 0}
+
+    # 平均して早く取られる駅から順に
+    station_stats = {
+        s: {
+            "claim_rate": round(total.claimed[s] / total.games, 4),
+            "first_claim_rate": round(total.first[s] / total.games, 4),
+            "mean_order": round(total.order_sum[s] / total.claimed[s], 2),
+            "mean_turn": round(total.turn_sum[s] / total.claimed[s], 2),
+        }
+        for s in sorted(total.claimed, key=lambda s: total.order_sum[s] / total.claimed[s])
+    }
+    return {
+        "files": len(paths),
+        "games": total.games,
+        "players": {n: total.players[n] for n in sorted(total.players)},
+        "turns": hist_summary(_histogram(total.turns)),
+        "rounds": hist_summary(_histogram(total.rounds)),
+        "rounds_hist": {n: total.rounds[n] for n in sorted(total.rounds)},
+        "rule_hit_rate": {rule["name"]: round(h / total.player_games, 4)
+                          for rule, h in zip(rules, total.rule_hits)},
+        "stations": station_stats,
+        "never_claimed": [s for s in stations if s not in total.claimed],
+    }
+
+def print_report(report, top=10):
+    print(f"📚 {report['files']} ファイル / {report['games']:,} ゲーム")
+    if not report["games"]:
+        return
+    print("人数ごとのゲーム数: " + ", ".join(f"{n}人 {c}" for n, c in report["players"].items()))
+    t, r = report["turns"], report["rounds"]
+    print(f"ゲームの長さ: 平均 {t['mean']} ターン（中央値 {t['p50']} / 95%: {t['p95']}）"
+          f" / 平均 {r['mean']} ラウンド（中央値 {r['p50']} / 95%: {r['p95']}）")
+    print("ボーナス達成率（プレイヤー1人あたり）:")
+    for name, rate in report["rule_hit_rate"].items():
+        print(f"  {name}: {rate * 100:.2f}%")
+    print(f"早く取られる駅（上位 {top}）:")
+    for station, s in list(report["stations"].items())[:top]:
+        print(f"  {station}: 平均 {s['mean_order']} 番目・{s['mean_turn']} ターン目 / "
+              f"取られた {s['claim_rate'] * 100:.1f}% / 最初に取られた {s['first_claim_rate'] * 100:.1f}%")
+    if report["never_claimed"]:
+        print(f"一度も取られなかった駅: {'、'.join(report['never_claimed'])}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="新幹線すごろくのゲームの記録を集計する")
+    parser.add_argument("archives", nargs="+", help="game_records.py の記録（.jsonl.gz）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--data", default=quiz_store.DEFAULT_PATH, help="駅一覧を読むクイズデータ（CSV またはパック）")
+    parser.add_argument("--rules", help="BONUS_RULES の代わりに使うルール（JSON）")
+    parser.add_argument("--top", type=int, default=10, help="表示する駅の数")
+    parser.add_argument("--json", help="結果をJSONで保存するファイル")
+    args = parser.parse_args(argv)
+
+    rules = BONUS_RULES
+    if args.rules:
+        with open(args.rules, encoding="utf-8") as f:
+            rules = json.load(f)
+
+    report = analyze(args.archives, load_stations(args.data), rules=rules, workers=args.workers)
+    print_report(report, args.top)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
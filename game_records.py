@@ -0,0 +1,147 @@
+# ==========================================
+# 終わったゲームの記録（アーカイブ）
+# ゲームが終わったら、結果発表の内容（得点と内訳）・最後のスタンプの持ち主・
+# 操作ログの全部を1ゲーム1行のJSONにして、gzip で圧縮したファイルに追記する。
+# 1行ずつ別の gzip メンバーとして1回の write で追記するので、途中までしか書けなかった
+# 行があってもそれより前の記録は読めて、複数のプロセスから追記しても行が混ざらない。
+# 記録の中身はゲームが終わったときに作り、圧縮と書き込みは専用のスレッドで行うので、
+# ストアの操作（ロックの中で呼ばれるリスナー）はファイルへの書き込みを待たない。
+# 集計は game_analytics.py で行う。
+#
+# 保存先は環境変数 SUGOROKU_ARCHIVE で変更できる（初期値は game_records.jsonl.gz、空にすると記録しない）
+# ==========================================
+import atexit
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from engine import EVENT_DECK_DATA
+
+ARCHIVE_PATH = os.environ.get("SUGOROKU_ARCHIVE", "game_records.jsonl.gz")
+RECORD_VERSION = 1
+DONE_SIZE = 4096    # 記録済みとして覚えておくゲームの数（古いものから忘れる）
+
+# ==========================================
+# 記録を作る
+# ==========================================
+def record_of(room, game, actions):
+    # 1ゲーム分の記録。actions は操作ログ（GameStore.history）
+    return {
+        "v": RECORD_VERSION,
+        "room": room,
+        "seed": game.seed,
+        "ended_at": round(time.time(), 3),
+        "players": list(game.players),
+        "bots": list(game.bots),
+        "turns": turns_of(actions, len(game.players)),
+        "stamps": {p: game.stamps.stamps_of(p) for p in game.players},
+        "results": game.results(),
+        "actions": [list(event) for event in actions],
+    }
+
+def _turn_changes(actions, num_players):
+    # 操作ごとに、その操作のあとで次のプレイヤーに交代したか。"next" と "goal" で交代するが、
+    # Game.go_to_next_player と同じく全員がゴールしてゲームが終わったときは交代しない
+    finished = set()
+    for event in actions:
+        if event[0] == "goal":
+            finished.add(event[1])
+        yield event[0] in ("next", "goal") and len(finished) < num_players
+
+def turns_of(actions, num_players):
+    # ターンの数（交代の回数 + 最初のターン）
+    return 1 + sum(_turn_changes(actions, num_players))
+
+def claims_of(actions, num_players):
+    # 誰も持っていなかったスタンプが取られた順に (ターン, 駅, プレイヤー) を返す。
+    # 「ゲット」と「幻のスタンプ帳」で増えた分を数え、移動は数えない
+    turn = 1
+    for event, changed in zip(actions, _turn_changes(actions, num_players)):
+        kind = event[0]
+        if kind == "get":
+            yield turn, event[1], event[2]
+        elif kind == "use" and EVENT_DECK_DATA[event[3]]["name"] == "幻のスタンプ帳":
+            for station in event[4:]:
+                yield turn, station, event[1]
+        turn += changed
+
+# ==========================================
+# 書く・読む
+# ==========================================
+def append(record, path=ARCHIVE_PATH):
+    line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+    data = gzip.compress(line.encode("utf-8"))
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+def read(path):
+    # 記録を1ゲームずつ返す（ファイル全体は読み込まない）。
+    # 書きかけで終わっているところまで来たら、そこで止める
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        except (EOFError, gzip.BadGzipFile):
+            return
+
+# ==========================================
+# ストアにつないで、ゲームが終わったら記録する
+# ==========================================
+class Archiver:
+    # GameStore.listen に渡す。ゲームごとに1回だけ（最初に終わったとき）記録する。
+    # ゲームは (ルーム, シード) で見分けるので、同じルームコードで始めた次のゲームも記録される。
+    # 記録はその場で作って、書き込みは専用のスレッドに渡す（プロセスの終了時には書き終えるまで待つ）
+    def __init__(self, store, path=ARCHIVE_PATH):
+        self.store = store
+        self.path = path
+        self._done = OrderedDict()   # room -> 記録したゲームのシード（最近終わった DONE_SIZE 件）
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name="sugoroku-archiver", daemon=True).start()
+        atexit.register(self.flush)
+
+    def __call__(self, room, game):
+        if not game.game_ended:
+            return
+        with self._lock:
+            if self._done.get(room) == game.seed:
+                return
+            self._done[room] = game.seed
+            self._done.move_to_end(room)
+            while len(self._done) > DONE_SIZE:
+                self._done.popitem(last=False)
+        self._queue.put(record_of(room, game, self.store.history(room)))
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            try:
+                append(record, self.path)
+            except OSError:
+                pass
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        # 渡した記録を全部書き終えるまで待つ
+        self._queue.join()
+
+_attached = {}
+_attach_lock = threading.Lock()
+
+def attach(store, path=ARCHIVE_PATH):
+    # プロセスにつき1回（2回目以降は同じものを返す）
+    with _attach_lock:
+        archiver = _attached.get(id(store))
+        if archiver is None:
+            archiver = _attached[id(store)] = Archiver(store, path)
+            store.listen(archiver)
+        return archiver
@@ -0,0 +1,355 @@
+# ==========================================
+# ルームごとのゲーム保存
+# ゲームをルームコードごとにローカルの SQLite（WAL モード）へ保存する。
+# 同じルームコードを開けばどの端末からでも続きから遊べる。
+# よく使うゲームはメモリ上の LRU キャッシュに置き、しばらく触られていない
+# ゲームはメモリから追い出す（内容は操作のたびにディスクへ書いてある）
+#
+# 保存は「追記だけの操作ログ」と「ときどきのスナップショット」で行う。
+# 1回の操作で書くのは小さな1行だけなので、ゲームが長くなっても書き込みは重くならない。
+# 状態は「いちばん近いスナップショット + その後の操作のやり直し」で復元でき、
+# これで何手でも元に戻せて、プロセスが落ちても続きから再開できる
+#
+# 同じデータベースを複数のプロセスで使ってもよいように、ルームごとに変更のたびに増える
+# version を持つ。メモリ上のゲームは version が変わっていたら読み直し、操作は
+# BEGIN IMMEDIATE で書き込みを1つずつにしてから、最新のゲームに適用する
+#
+# クイズの正解・不正解はゲームをまたいで問題ごとに数えておき（quiz_stats）、
+# 「むずかしい問題」「実力に合わせた問題」を選ぶ重みに使う
+#
+# listen() で登録した関数は、ゲームが作られた・変わった・戻されたたびに (room, game) で
+# 呼ばれる（ほかの端末へのライブ中継などに使う。ロックの中で呼ぶので、すぐ返すこと）
+# ==========================================
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import quiz_store
+from engine import Game, QuestionPicker
+
+DEFAULT_DB_PATH = os.environ.get("SUGOROKU_DB", "games.sqlite3")
+CACHE_SIZE = 64            # メモリに置いておくゲーム数の上限
+IDLE_SECONDS = 30 * 60     # これより長く触られていないゲームはメモリから追い出す
+KEEP_DAYS = 7              # これより古いゲームはディスクからも消す
+SNAPSHOT_EVERY = 20        # この操作数ごとにスナップショットを書く
+
+# 読み間違えにくい文字だけでルームコードを作る
+ROOM_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+ROOM_LENGTH = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rooms (
+    room TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS actions (
+    room TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    PRIMARY KEY (room, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS snapshots (
+    room TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (room, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS quiz_stats (
+    key TEXT PRIMARY KEY,
+    correct INTEGER NOT NULL DEFAULT 0,
+    wrong INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+"""
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+def _encode(game):
+    return zlib.compress(_dumps(game.to_dict()).encode("utf-8"))
+
+def _decode(blob):
+    return Game.from_dict(json.loads(zlib.decompress(blob).decode("utf-8")))
+
+class GameStore:
+    # プロセスに1つ。SQLite の接続も1本をロックで守って使い回す
+    def __init__(self, path=DEFAULT_DB_PATH, cache_size=CACHE_SIZE, idle_seconds=IDLE_SECONDS):
+        self.path = path
+        self.cache_size = cache_size
+        self.idle_seconds = idle_seconds
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pid = None
+        self._cache = OrderedDict()  # room -> (game, 最後に触った時刻, version)
+        self._pickers = {}           # (問題集のパス, 更新時刻) -> QuestionPicker
+        self._listeners = []
+
+    def _connection(self):
+        # fork された子プロセスでは親の接続を使わずに開き直す
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            if "version" not in {row[1] for row in conn.execute("PRAGMA table_info(rooms)")}:
+                # version を足す前に作られたデータベース
+                conn.execute("ALTER TABLE rooms ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    # --- ルーム ---
+    def new_room(self):
+        with self._lock:
+            conn = self._connection()
+            while True:
+                room = "".join(secrets.choice(ROOM_ALPHABET) for _ in range(ROOM_LENGTH))
+                if room not in self._cache and conn.execute(
+                        "SELECT 1 FROM rooms WHERE room = ?", (room,)).fetchone() is None:
+                    return room
+
+    def exists(self, room):
+        return self.load(room) is not None
+
+    # --- 読み書き ---
+    def create(self, room, game):
+        # 新しいゲームを登録する（最初のスナップショットを書く）
+        now = time.monotonic()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN")
+                conn.execute("INSERT INTO rooms (room, updated_at) VALUES (?, ?)", (room, time.time()))
+                conn.execute("INSERT INTO snapshots (room, seq, state) VALUES (?, ?, ?)",
+                             (room, game.seq, _encode(game)))
+            self._remember(room, game, now, 0)
+            self._notify(room, game)
+
+    def load(self, room):
+        # メモリにあって最新ならそれを、なければ（ほかのプロセスが変えていたら）
+        # スナップショット + 操作ログから復元する（ルームがなければ None）
+        now = time.monotonic()
+        with self._lock:
+            version = self._version(self._connection(), room)
+            if version is None:
+                self._cache.pop(room, None)
+                return None
+            entry = self._cache.get(room)
+            if entry is not None and entry[2] == version:
+                self._cache[room] = (entry[0], now, version)
+                self._cache.move_to_end(room)
+                return entry[0]
+            game = self._rebuild(room)
+            if game is not None:
+                self._remember(room, game, now, version)
+            return game
+
+    def act(self, room, game, action):
+        # 操作を1つ適用して、ログに1行追記する。結果付きのイベントを返す。
+        # game がほかのプロセスの変更より古ければ、読み直したゲームのほうに適用する。
+        # ルール上できない操作（ValueError）や書き込みの失敗では、メモリ上のゲームを捨てて
+        # 次の load でディスクから読み直す
+        now = time.monotonic()
+        with self._lock:
+            conn = self._connection()
+            try:
+                with conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    game, version = self._latest(conn, room, game)
+                    event = game.apply(action)
+                    conn.execute("INSERT INTO actions (room, seq, action) VALUES (?, ?, ?)",
+                                 (room, game.seq, _dumps(event)))
+                    if event[0] == "answer":
+                        self._record_answer(conn, event[2], event[3], 1)
+                    if game.seq % SNAPSHOT_EVERY == 0:
+                        conn.execute("INSERT OR REPLACE INTO snapshots (room, seq, state) VALUES (?, ?, ?)",
+                                     (room, game.seq, _encode(game)))
+                    conn.execute("UPDATE rooms SET updated_at = ?, version = ? WHERE room = ?",
+                                 (time.time(), version + 1, room))
+            except Exception:
+                self._cache.pop(room, None)
+                raise
+            self._remember(room, game, now, version + 1)
+            self._notify(room, game)
+            return event
+
+    def _version(self, conn, room):
+        row = conn.execute("SELECT version FROM rooms WHERE room = ?", (room,)).fetchone()
+        return row[0] if row else None
+
+    def _latest(self, conn, room, game):
+        # (最新のゲーム, その version)。game がメモリ上の最新のものならそのまま使う
+        version = self._version(conn, room)
+        if version is None:
+            raise ValueError("そのルームのゲームは見つかりません")
+        entry = self._cache.get(room)
+        if entry is not None and entry[0] is game and entry[2] == version:
+            return game, version
+        # メモリにない・古いゲームは、操作の数が同じでも中身が違うことがある
+        # （ほかのプロセスで取り消してから別の操作をしたときなど）ので、ディスクから読み直す
+        fresh = self._rebuild(room)
+        if fresh is not None:
+            fresh.picker = game.picker
+        return fresh, version
+
+    def undo(self, room, steps=1):
+        # 最後の steps 個の操作を取り消したゲームを返す（取り消した操作はログから消す）
+        now = time.monotonic()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                version = self._version(conn, room)
+                current = self.load(room)
+                if current is None:
+                    return None
+                target = max(current.seq - steps, 0)
+                game = self._rebuild(room, target)
+                for (action,) in conn.execute(
+                        "SELECT action FROM actions WHERE room = ? AND seq > ?", (room, target)).fetchall():
+                    event = json.loads(action)
+                    if event[0] == "answer":
+                        self._record_answer(conn, event[2], event[3], -1)
+                conn.execute("DELETE FROM actions WHERE room = ? AND seq > ?", (room, target))
+                conn.execute("DELETE FROM snapshots WHERE room = ? AND seq > ?", (room, target))
+                conn.execute("UPDATE rooms SET updated_at = ?, version = ? WHERE room = ?",
+                             (time.time(), version + 1, room))
+            self._remember(room, game, now, version + 1)
+            self._notify(room, game)
+            return game
+
+    def history(self, room, limit=None):
+        # 操作ログ（古い順）。limit を指定すると最後の limit 件だけ
+        with self._lock:
+            if limit is None:
+                rows = self._connection().execute(
+                    "SELECT action FROM actions WHERE room = ? ORDER BY seq", (room,)).fetchall()
+            else:
+                rows = self._connection().execute(
+                    "SELECT action FROM actions WHERE room = ? ORDER BY seq DESC LIMIT ?", (room, limit)).fetchall()
+                rows.reverse()
+        return [json.loads(row[0]) for row in rows]
+
+    def _rebuild(self, room, upto=None):
+        # upto 番目の操作の直後の状態を、その手前の最新スナップショットからやり直して作る
+        conn = self._connection()
+        upto = float("inf") if upto is None else upto
+        row = conn.execute(
+            "SELECT seq, state FROM snapshots WHERE room = ? AND seq <= ? ORDER BY seq DESC LIMIT 1",
+            (room, upto)).fetchone()
+        if row is None:
+            return None
+        game = _decode(row[1])
+        for (action,) in conn.execute(
+                "SELECT action FROM actions WHERE room = ? AND seq > ? AND seq <= ? ORDER BY seq",
+                (room, row[0], upto)):
+            game.apply(json.loads(action))
+        return game
+
+    def delete(self, room):
+        with self._lock:
+            self._cache.pop(room, None)
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN")
+                for table in ("rooms", "actions", "snapshots"):
+                    conn.execute(f"DELETE FROM {table} WHERE room = ?", (room,))
+
+    # --- 変化の通知 ---
+    def listen(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def _notify(self, room, game):
+        for listener in self._listeners:
+            listener(room, game)
+
+    # --- クイズの難易度 ---
+    def picker(self, quiz):
+        # 問題集ごとの抽選器（問題集が読み直されたら作り直す）。
+        # 別のプロセスで記録された答えは、作り直すまで重みに入らない
+        with self._lock:
+            cache_key = (quiz.path, quiz.mtime_ns)
+            picker = self._pickers.get(cache_key)
+            if picker is None:
+                stats = {key: (correct, wrong) for key, correct, wrong in
+                         self._connection().execute("SELECT key, correct, wrong FROM quiz_stats")}
+                picker = QuestionPicker((quiz_store.question_key(q) for q in quiz), stats)
+                self._pickers = {cache_key: picker}
+            return picker
+
+    def pick_question(self, room, game, quiz, mode):
+        # mode に合わせて、このゲームでまだ出していない問題を選んで出題する
+        # （選ぶのは Game.apply で、ゲームの "quiz" の乱数列を使う）
+        with self._lock:
+            game.picker = self.picker(quiz)
+            return self.act(room, game, ("pick_quiz", mode))
+
+    def question_stats(self, key):
+        # (正解数, 不正解数)
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT correct, wrong FROM quiz_stats WHERE key = ?", (key,)).fetchone()
+        return tuple(row) if row else (0, 0)
+
+    def _record_answer(self, conn, key, correct, count):
+        column = "correct" if correct else "wrong"
+        conn.execute(f"INSERT INTO quiz_stats (key, {column}) VALUES (?, MAX(?, 0)) "
+                     f"ON CONFLICT(key) DO UPDATE SET {column} = MAX({column} + ?, 0)", (key, count, count))
+        for picker in self._pickers.values():
+            picker.record(key, correct, count)
+
+    # --- キャッシュ ---
+    def _remember(self, room, game, now, version):
+        self._cache[room] = (game, now, version)
+        self._cache.move_to_end(room)
+        self.evict_idle(now)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def evict_idle(self, now=None):
+        # しばらく触られていないゲームをメモリから追い出す（古い順に並んでいる）
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            while self._cache:
+                room, (_, touched, _) = next(iter(self._cache.items()))
+                if now - touched < self.idle_seconds:
+                    break
+                self._cache.popitem(last=False)
+
+    def cached_rooms(self):
+        with self._lock:
+            return list(self._cache)
+
+    def purge(self, keep_days=KEEP_DAYS):
+        # 古いゲームをディスクから消す
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN")
+                old = "SELECT room FROM rooms WHERE updated_at < ?"
+                cutoff = time.time() - keep_days * 86400
+                for table in ("actions", "snapshots"):
+                    conn.execute(f"DELETE FROM {table} WHERE room IN ({old})", (cutoff,))
+                conn.execute("DELETE FROM rooms WHERE updated_at < ?", (cutoff,))
+
+# ==========================================
+# プロセス内で共有するストア
+# ==========================================
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(path=DEFAULT_DB_PATH):
+    path = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = GameStore(path)
+            store.purge()
+            _stores[path] = store
+        return store
@@ -0,0 +1,206 @@
+# ==========================================
+# 処理時間の計測とローカルへの書き出し（運用者向け・オプトイン）
+# 環境変数 SUGOROKU_METRICS に出力先のファイルを指定したときだけ有効になる。
+#   SUGOROKU_METRICS=metrics.prom   → Prometheus のテキスト形式で上書き
+#   SUGOROKU_METRICS=metrics.jsonl  → 1回の書き出しごとに1行のJSONを追記
+#   SUGOROKU_METRICS_INTERVAL=15    → 書き出しの間隔（秒）
+# 無効のときは instrument() は関数をそのまま返し、timed() は何もしない
+# 使い回しのコンテキストを返すだけなので、ほぼコストがかからない
+# ==========================================
+import atexit
+import bisect
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+PATH = os.environ.get("SUGOROKU_METRICS")
+ENABLED = bool(PATH)
+INTERVAL = float(os.environ.get("SUGOROKU_METRICS_INTERVAL", "15"))
+SESSION_TTL = 60 * 60  # これより長く更新のないセッションの値は書き出しから外す
+
+# ヒストグラムの区切り（秒）
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def cumulative(self):
+        # Prometheus 形式の「le 以下の数」
+        total = 0
+        result = []
+        for n in self.counts:
+            total += n
+            result.append(total)
+        return result
+
+class Registry:
+    # プロセス内で集計する。セッションごとの値は (名前, セッションID) で持つ
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self._touched = {}
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, session=None, value=1):
+        with self._lock:
+            key = (name, session)
+            self.counters[key] = self.counters.get(key, 0) + value
+            self._touched[session] = time.time()
+
+    def set_gauge(self, name, value, session=None):
+        with self._lock:
+            self.gauges[(name, session)] = value
+            self._touched[session] = time.time()
+
+    def prune(self, now=None):
+        # 長く更新のないセッションの値を捨てる
+        now = time.time() if now is None else now
+        with self._lock:
+            stale = {s for s, t in self._touched.items() if s is not None and now - t > SESSION_TTL}
+            if not stale:
+                return
+            for table in (self.counters, self.gauges):
+                for key in [k for k in table if k[1] in stale]:
+                    del table[key]
+            for s in stale:
+                del self._touched[s]
+
+    # --- 書き出し ---
+    def snapshot(self):
+        with self._lock:
+            return {
+                "time": time.time(),
+                "histograms": {
+                    name: {"buckets": dict(zip([*map(str, BUCKETS), "+Inf"], h.cumulative())),
+                           "sum": round(h.sum, 6), "count": h.count}
+                    for name, h in self.histograms.items()
+                },
+                "counters": [{"name": n, "session": s, "value": v} for (n, s), v in self.counters.items()],
+                "gauges": [{"name": n, "session": s, "value": v} for (n, s), v in self.gauges.items()],
+            }
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            if self.histograms:
+                lines.append("# TYPE sugoroku_duration_seconds histogram")
+            for name, h in sorted(self.histograms.items()):
+                for le, n in zip([*map(str, BUCKETS), "+Inf"], h.cumulative()):
+                    lines.append(f'sugoroku_duration_seconds_bucket{{name="{name}",le="{le}"}} {n}')
+                lines.append(f'sugoroku_duration_seconds_sum{{name="{name}"}} {h.sum:.6f}')
+                lines.append(f'sugoroku_duration_seconds_count{{name="{name}"}} {h.count}')
+            for kind, table, suffix in (("counter", self.counters, "_total"), ("gauge", self.gauges, "")):
+                for name in sorted({n for n, _ in table}):
+                    lines.append(f"# TYPE sugoroku_{name}{suffix} {kind}")
+                    for (n, session), value in table.items():
+                        if n == name:
+                            label = f'{{session="{session}"}}' if session is not None else ""
+                            lines.append(f"sugoroku_{name}{suffix}{label} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        self.prune()
+        if path.endswith(".jsonl"):
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.snapshot(), ensure_ascii=False) + "\n")
+        else:
+            # 読み手が途中までのファイルを見ないように、書き終えてから置き換える
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.render_prometheus())
+            os.replace(tmp, path)
+
+registry = Registry()
+
+# ==========================================
+# 定期的な書き出し
+# ==========================================
+_writer_lock = threading.Lock()
+_writer = None
+
+def _write_loop():
+    while True:
+        time.sleep(INTERVAL)
+        try:
+            registry.write(PATH)
+        except OSError:
+            pass
+
+def _ensure_writer():
+    global _writer
+    if _writer is not None:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, name="sugoroku-metrics", daemon=True)
+            _writer.start()
+            atexit.register(registry.write, PATH)
+
+# ==========================================
+# 計測用の関数
+# ==========================================
+_NULL = contextlib.nullcontext()
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        # st.rerun() などで途中で抜けたときも記録する
+        registry.observe(self.name, time.perf_counter() - self.start)
+        _ensure_writer()
+        return False
+
+def timed(name):
+    # with metrics.timed("phase_main"): ...
+    return _Timer(name) if ENABLED else _NULL
+
+def instrument(name):
+    # 関数の処理時間を name で記録するデコレーター（無効なら関数をそのまま返す）
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Timer(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count(name, session=None, value=1):
+    if ENABLED:
+        registry.inc(name, session, value)
+        _ensure_writer()
+
+def gauge(name, value, session=None):
+    if ENABLED:
+        registry.set_gauge(name, value, session)
+        _ensure_writer()
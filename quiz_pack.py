@@ -0,0 +1,207 @@
+# ==========================================
+# クイズパック（大きな問題集用のバイナリ形式）
+# 1つ以上の CSV をまとめて1つのパックファイルに変換しておき、アプリはそれを
+# メモリマップして、出題するときに1問ずつ読み出す。
+# 起動時に読むのはヘッダーと駅名の一覧だけなので、問題数が何千・何万に
+# なっても起動時間とメモリはほとんど増えない。
+# 正解や選択肢の抜けなどのチェックはパックを作るときに済ませる。
+#
+# 使い方:
+#   python quiz_pack.py quiz_data.csv -o quiz_data.pack
+#   python quiz_pack.py tohoku.csv kyushu.csv -o all.pack
+#   python quiz_pack.py quiz_data.csv --check      （チェックだけ）
+#   SUGOROKU_QUIZ=all.pack streamlit run app.py
+#
+# ファイルの中身（数値はすべてリトルエンディアン）:
+#   ヘッダー       HEADER
+#   問題の本体     1問ごとに「駅番号(u32) + 各項目を \0 でつないだ UTF-8」
+#   オフセット表   問題数 + 1 個の u64（i 問目は offsets[i] 〜 offsets[i+1]）
+#   駅ごとの索引   駅数 + 1 個の u32 の区切り + 問題番号(u32)を駅ごとに並べたもの
+#   駅名           \0 でつないだ UTF-8（出現順）
+# ==========================================
+import argparse
+import csv
+import mmap
+import os
+import struct
+import sys
+
+from quiz_store import Question
+
+MAGIC = b"SGQP"
+VERSION = 1
+# magic, version, 予約, 問題数, 駅数, オフセット表の位置, 駅ごとの索引の位置, 駅名の位置
+HEADER = struct.Struct("<4sHHIIQQQ")
+ROW_HEAD = struct.Struct("<I")
+FIELDS = ("問題文", "選択肢A", "選択肢B", "選択肢C", "正解", "解説")
+SEP = b"\0"
+
+# ==========================================
+# パックを作る
+# ==========================================
+def read_rows(paths):
+    # 全 CSV の行を (ファイル名, 行番号, 行) で返す
+    for path in paths:
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield path, reader.line_num, row
+
+def validate(row):
+    # 1行分のエラーメッセージのリスト（問題なければ空）
+    def cell(name):
+        return (row.get(name) or "").strip()
+
+    errors = []
+    if not cell("駅名"):
+        errors.append("駅名がありません")
+    if not cell("問題文"):
+        errors.append("問題文がありません")
+    answer = cell("正解")
+    if not answer:
+        errors.append("正解がありません")
+    choices = [cell(name) for name in ("選択肢A", "選択肢B", "選択肢C")]
+    if any(choices):
+        if not all(choices):
+            errors.append("選択肢A〜Cのどれかが空です")
+        elif answer:
+            label, _, text = answer.partition(".")
+            if label not in ("A", "B", "C"):
+                errors.append(f"正解「{answer}」が A. / B. / C. で始まっていません")
+            elif text.strip() and text.strip() != choices["ABC".index(label)]:
+                errors.append(f"正解「{answer}」が選択肢{label}「{choices['ABC'.index(label)]}」と一致しません")
+    for name in ("駅名", *FIELDS):
+        if "\0" in cell(name):
+            errors.append(f"{name}にNUL文字が含まれています")
+    return errors
+
+def build(paths, out_path):
+    # CSV をチェックしてパックに変換する。問題があれば全部まとめて ValueError
+    stations = {}       # 駅名 -> 駅番号（出現順）
+    postings = []       # 駅番号ごとの問題番号
+    offsets = [HEADER.size]
+    errors = []
+    tmp = f"{out_path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"\0" * HEADER.size)
+        for path, line, row in read_rows(paths):
+            row_errors = validate(row)
+            if row_errors:
+                errors.extend(f"{path}:{line}: {e}" for e in row_errors)
+                continue
+            station = row["駅名"].strip()
+            if station not in stations:
+                stations[station] = len(stations)
+                postings.append([])
+            postings[stations[station]].append(len(offsets) - 1)
+            body = SEP.join((row.get(name) or "").strip().encode("utf-8") for name in FIELDS)
+            f.write(ROW_HEAD.pack(stations[station]))
+            f.write(body)
+            offsets.append(offsets[-1] + ROW_HEAD.size + len(body))
+        if errors:
+            f.close()
+            os.remove(tmp)
+            raise ValueError("\n".join(errors))
+
+        num_questions = len(offsets) - 1
+        f.write(b"\0" * (-offsets[-1] % 8))
+        offsets_pos = f.tell()
+        f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        index_pos = f.tell()
+        bounds = [0]
+        for ids in postings:
+            bounds.append(bounds[-1] + len(ids))
+        f.write(struct.pack(f"<{len(bounds)}I", *bounds))
+        f.write(struct.pack(f"<{num_questions}I", *(i for ids in postings for i in ids)))
+        names_pos = f.tell()
+        f.write(SEP.join(s.encode("utf-8") for s in stations))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, 0, num_questions, len(stations), offsets_pos, index_pos, names_pos))
+    # 読み込み中のプロセスがあっても壊れないように、書き終えてから置き換える
+    os.replace(tmp, out_path)
+    return num_questions, len(stations)
+
+# ==========================================
+# パックを読む（QuizStore と同じ使い方ができる）
+# ==========================================
+class QuizPack:
+    __slots__ = ("path", "mtime_ns", "stations", "_station_ids", "_map", "_count", "_offsets_pos", "_index_pos")
+
+    def __init__(self, path, mtime_ns, mapped):
+        magic, version, _, count, num_stations, offsets_pos, index_pos, names_pos = HEADER.unpack_from(mapped)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} はクイズパックではありません")
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self._map = mapped
+        self._count = count
+        self._offsets_pos = offsets_pos
+        self._index_pos = index_pos
+        names = mapped[names_pos:]
+        self.stations = tuple(n.decode("utf-8") for n in names.split(SEP)) if num_stations else ()
+        self._station_ids = {s: i for i, s in enumerate(self.stations)}
+
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as f:
+            mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(path, mtime_ns, mapped)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        start, end = struct.unpack_from("<2Q", self._map, self._offsets_pos + 8 * index)
+        (station,) = ROW_HEAD.unpack_from(self._map, start)
+        text, a, b, c, answer, explanation = (
+            v.decode("utf-8") or None for v in self._map[start + ROW_HEAD.size:end].split(SEP))
+        return Question(
+            station=self.stations[station],
+            text=text,
+            choices=(a, b, c) if a is not None else None,
+            answer=answer,
+            explanation=explanation,
+        )
+
+    def questions_of(self, station):
+        # その駅の問題番号（CSV の順）
+        i = self._station_ids.get(station)
+        if i is None:
+            return ()
+        first, last = struct.unpack_from("<2I", self._map, self._index_pos + 4 * i)
+        postings_pos = self._index_pos + 4 * (len(self.stations) + 1)
+        return struct.unpack_from(f"<{last - first}I", self._map, postings_pos + 4 * first)
+
+# ==========================================
+# コマンドライン
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="クイズの CSV をパックに変換する")
+    parser.add_argument("csv", nargs="+", help="変換する CSV（複数指定するとつなげる）")
+    parser.add_argument("-o", "--output", help="出力するパック（省略すると最初の CSV の拡張子を .pack にしたもの）")
+    parser.add_argument("--check", action="store_true", help="チェックだけしてパックは作らない")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        errors = [f"{path}:{line}: {e}" for path, line, row in read_rows(args.csv) for e in validate(row)]
+        for error in errors:
+            print(f"⚠️ {error}")
+        return 1 if errors else 0
+
+    output = args.output or os.path.splitext(args.csv[0])[0] + ".pack"
+    try:
+        num_questions, num_stations = build(args.csv, output)
+    except ValueError as e:
+        for error in str(e).splitlines():
+            print(f"⚠️ {error}")
+        return 1
+    print(f"✅ {output}: {num_questions} 問 / {num_stations} 駅")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
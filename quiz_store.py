@@ -0,0 +1,93 @@
+# ==========================================
+# クイズデータの読み込み
+# pandas を使わずに標準の csv モジュールで一度だけ読み込み、
+# 変更できないタプルとしてプロセス内の全セッションで共有する。
+# CSV の更新時刻が変わったら次のアクセスで読み直す。
+# 大きな問題集は quiz_pack.py で作ったパック（.pack）を指定すると、
+# 全部を読み込まずにメモリマップして1問ずつ読み出す
+# ==========================================
+import csv
+import hashlib
+import os
+import threading
+from collections import namedtuple
+
+DEFAULT_PATH = os.environ.get("SUGOROKU_QUIZ", "quiz_data.csv")
+
+# 1問分のデータ（choices は (A, B, C)、選択肢のない問題は None）
+Question = namedtuple("Question", ["station", "text", "choices", "answer", "explanation"])
+
+def question_key(question):
+    # 問題集の並びが変わっても同じ問題を指せるように、駅名と問題文から作るキー
+    text = f"{question.station}\n{question.text}".encode("utf-8")
+    return hashlib.blake2b(text, digest_size=8).hexdigest()
+
+class QuizStore:
+    __slots__ = ("path", "mtime_ns", "questions", "stations", "_by_station")
+
+    def __init__(self, path, mtime_ns, questions):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.questions = tuple(questions)
+        by_station = {}
+        for i, q in enumerate(self.questions):
+            by_station.setdefault(q.station, []).append(i)
+        self._by_station = {s: tuple(ids) for s, ids in by_station.items()}
+        self.stations = tuple(self._by_station)
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __getitem__(self, index):
+        return self.questions[index]
+
+    def questions_of(self, station):
+        # その駅の問題番号（CSV の順）
+        return self._by_station.get(station, ())
+
+    @classmethod
+    def from_csv(cls, path):
+        mtime_ns = os.stat(path).st_mtime_ns
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            questions = [_to_question(row) for row in csv.DictReader(f)]
+        return cls(path, mtime_ns, questions)
+
+def _to_question(row):
+    def cell(name):
+        value = (row.get(name) or "").strip()
+        return value or None
+
+    choices = (cell("選択肢A"), cell("選択肢B"), cell("選択肢C"))
+    return Question(
+        station=cell("駅名"),
+        text=cell("問題文"),
+        choices=choices if choices[0] is not None else None,
+        answer=cell("正解"),
+        explanation=cell("解説"),
+    )
+
+# ==========================================
+# プロセス内で共有するキャッシュ
+# ==========================================
+_stores = {}
+_lock = threading.Lock()
+
+def _open(path):
+    if path.endswith(".pack"):
+        from quiz_pack import QuizPack
+        return QuizPack.open(path)
+    return QuizStore.from_csv(path)
+
+def load(path=DEFAULT_PATH):
+    # ファイルがなければ FileNotFoundError
+    path = os.path.abspath(path)
+    mtime_ns = os.stat(path).st_mtime_ns
+    store = _stores.get(path)
+    if store is not None and store.mtime_ns == mtime_ns:
+        return store
+    with _lock:
+        store = _stores.get(path)
+        if store is None or store.mtime_ns != mtime_ns:
+            store = _open(path)
+            _stores[path] = store
+        return store
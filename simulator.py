@@ -0,0 +1,297 @@
+# ==========================================
+# 新幹線すごろく モンテカルロ・シミュレーター
+# BONUS_RULES / EVENT_DECK_DATA の点数や重みを変えたときの影響を、
+# 大量のゲームをまとめて（NumPy配列で）回して確認するためのツール
+#
+# 使い方:
+#   python simulator.py --games 1000000 --players 4 --workers 8 --seed 0
+#   python simulator.py --rules my_rules.json --json report.json
+# ==========================================
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import quiz_store
+
+from board import START_STATION
+from engine import BONUS_RULES, EVENT_DECK_DATA, CompiledRules, compile_deck, get_board, load_stations
+
+# 止まるマスの種類と出やすさ（紙の盤面のマス数の比率）
+SQUARE_WEIGHTS = {
+    "station": 40,  # 駅マス: 誰も持っていないスタンプをゲット
+    "quiz": 20,     # クイズマス: 正解ならスタンプをゲット
+    "item": 15,     # アイテムマス: イベントカードを引いてすぐ使う
+    "battle": 5,    # 一発逆転バトル: 正解なら他人から1つもらう、不正解なら1つ戻す
+    "plus": 5,      # プラスマス: もう一度サイコロを振って進む
+    "minus": 5,     # マイナスマス: もう一度サイコロを振って戻る
+    "blank": 10,    # 何もないマス
+}
+SQUARE_NAMES = list(SQUARE_WEIGHTS)
+
+BOARD_LENGTH = 60   # スタートからゴールまでのマス数
+MAX_ROUNDS = 200    # 念のための打ち切りラウンド数
+CHUNK_SIZE = 20000  # 1プロセスにまとめて渡すゲーム数
+PICK_TRIES = 8      # ランダムな駅を引き直す回数（失敗した行だけ全駅から探す）
+MAX_DICE = 6
+
+# ==========================================
+# 路線図を配列にする
+# ==========================================
+def compile_board(stations, max_dice=MAX_DICE):
+    # Board.reach を「駅番号・サイコロの目・j 番目の行き先」で引ける配列にする。
+    # num_dest[駅, 目] 行き先の数 / dest[駅, 目, j] 着く駅 /
+    # passed[駅, 目, j] 通った駅のスタンプの列番号（詰め物とスタンプのない駅は -1）
+    board = get_board()
+    column = {s: i for i, s in enumerate(stations)}
+    n = len(board.stations)
+    width = max(len(board.reach[i][k]) for i in range(n) for k in range(1, max_dice + 1))
+    num_dest = np.zeros((n, max_dice + 1), dtype=np.int64)
+    dest = np.zeros((n, max_dice + 1, width), dtype=np.int64)
+    passed = np.full((n, max_dice + 1, width, max_dice), -1, dtype=np.int64)
+    for i in range(n):
+        for k in range(1, max_dice + 1):
+            num_dest[i, k] = len(board.reach[i][k])
+            for j, (d, path) in enumerate(board.reach[i][k].items()):
+                dest[i, k, j] = d
+                passed[i, k, j, :len(path)] = [column.get(s, -1) for s in path]
+    return {"start": board.index[START_STATION], "num_dest": num_dest, "dest": dest, "passed": passed}
+
+# ==========================================
+# 1チャンク分のシミュレーション
+# ==========================================
+def _pick(owners, rows, targets, rng):
+    # rows の各ゲームについて、持ち主が targets の駅をランダムに1つ選ぶ（なければ -1）
+    num_stations = owners.shape[1]
+    picked = np.full(len(rows), -1, dtype=np.int64)
+    if len(rows) == 0:
+        return picked
+    tries = rng.integers(0, num_stations, size=(len(rows), PICK_TRIES))
+    ok = owners[rows[:, None], tries] == targets[:, None]
+    found = ok.any(axis=1)
+    picked[found] = tries[found, ok[found].argmax(axis=1)]
+
+    rest = np.flatnonzero(~found)
+    if len(rest):
+        keys = rng.random((len(rest), num_stations))
+        keys[owners[rows[rest]] != targets[rest, None]] = -1.0
+        best = keys.argmax(axis=1)
+        has = keys[np.arange(len(rest)), best] >= 0
+        picked[rest[has]] = best[has]
+    return picked
+
+def _grab_unowned(owners, rows, player, rng):
+    # rows のゲームで player が誰も持っていないスタンプを1つゲットする
+    picked = _pick(owners, rows, np.full(len(rows), -1), rng)
+    got = picked >= 0
+    owners[rows[got], picked[got]] = player
+
+def _steal(owners, rows, player, num_players, rng):
+    # rows のゲームで、ほかのプレイヤーを1人選んでスタンプを1つもらう
+    if num_players < 2 or len(rows) == 0:
+        return
+    victims = (player + rng.integers(1, num_players, size=len(rows))) % num_players
+    picked = _pick(owners, rows, victims, rng)
+    got = picked >= 0
+    owners[rows[got], picked[got]] = player
+
+def _give_back(owners, rows, player, rng):
+    # rows のゲームで player のスタンプを1つ誰のものでもない状態に戻す
+    picked = _pick(owners, rows, np.full(len(rows), player), rng)
+    got = picked >= 0
+    owners[rows[got], picked[got]] = -1
+
+def _grab_passed(owners, rows, passed, player):
+    # rows のゲームで、通った駅（passed の各行）のうち誰も持っていないスタンプをゲットする
+    games = np.broadcast_to(rows[:, None], passed.shape)
+    hit = passed >= 0
+    hit[hit] = owners[games[hit], passed[hit]] == -1
+    owners[games[hit], passed[hit]] = player
+
+def simulate_chunk(num_games, num_players, num_stations, seed, config):
+    rng = np.random.default_rng(seed)
+    square_p = np.array([config["square_weights"][k] for k in SQUARE_NAMES], dtype=float)
+    square_p /= square_p.sum()
+    card_names = [card["name"] for card in config["deck"]]
+    card_table = compile_deck(tuple(card["weight"] for card in config["deck"]))
+    p_correct = config["p_correct"]
+    board_length = config["board_length"]
+    route = config["route"]
+
+    owners = np.full((num_games, num_stations), -1, dtype=np.int8)
+    position = np.zeros((num_games, num_players), dtype=np.int32)
+    finished = np.zeros((num_games, num_players), dtype=bool)
+    resting = np.zeros((num_games, num_players), dtype=bool)
+    rounds = np.zeros(num_games, dtype=np.int32)
+    # 路線図の上の駅（サイコロの目だけ進み、行き先が分かれるところはランダムに選ぶ）
+    station = np.full((num_games, num_players), route["start"], dtype=np.int64)
+
+    def card_is(cards, name):
+        return cards == card_names.index(name) if name in card_names else np.zeros(len(cards), dtype=bool)
+
+    for _ in range(config["max_rounds"]):
+        alive = ~finished.all(axis=1)
+        if not alive.any():
+            break
+        rounds[alive] += 1
+        for p in range(num_players):
+            active = alive & ~finished[:, p]
+            # 1回休み
+            skipped = active & resting[:, p]
+            resting[skipped, p] = False
+            rows = np.flatnonzero(active & ~skipped)
+            if len(rows) == 0:
+                continue
+
+            dice = rng.integers(1, 7, size=len(rows))
+            move = dice.copy()
+            square = rng.choice(len(SQUARE_NAMES), size=len(rows), p=square_p)
+            sq = {name: square == i for i, name in enumerate(SQUARE_NAMES)}
+            correct = rng.random(len(rows)) < p_correct
+
+            _grab_unowned(owners, rows[sq["station"] | (sq["quiz"] & correct)], p, rng)
+            _steal(owners, rows[sq["battle"] & correct], p, num_players, rng)
+            _give_back(owners, rows[sq["battle"] & ~correct], p, rng)
+            move += np.where(sq["plus"], rng.integers(1, 7, size=len(rows)), 0)
+            move -= np.where(sq["minus"], rng.integers(1, 7, size=len(rows)), 0)
+
+            here = station[rows, p]
+            j = (rng.random(len(rows)) * route["num_dest"][here, dice]).astype(np.int64)
+            passed = route["passed"][here, dice, j]
+            station[rows, p] = route["dest"][here, dice, j]
+
+            # アイテムマス: 引いたカードはその場で使う
+            item = np.flatnonzero(sq["item"])
+            cards = card_table.sample_many(rng, len(item))
+            extra = rng.integers(1, 7, size=len(item))
+            move[item] += np.where(card_is(cards, "追加乗車＋"), extra, 0)
+            move[item] -= np.where(card_is(cards, "追加乗車ー"), rng.integers(1, 4, size=len(item)), 0)
+            move[item] += np.where(card_is(cards, "新幹線乗り換え"), extra * 2, 0)
+            resting[rows[item[card_is(cards, "お土産の誘惑")]], p] = True
+            _grab_unowned(owners, rows[item[card_is(cards, "旅の思い出") | card_is(cards, "博識（はくしき）")]], p, rng)
+            _steal(owners, rows[item[card_is(cards, "思い出の共有")]], p, num_players, rng)
+            # 幻のスタンプ帳: このターンに路線図の上で通った駅のスタンプをゲット
+            magic = item[card_is(cards, "幻のスタンプ帳")]
+            _grab_passed(owners, rows[magic], passed[magic], p)
+
+            position[rows, p] = np.maximum(position[rows, p] + move, 0)
+            finished[rows, p] = position[rows, p] >= board_length
+
+    owned = owners[:, None, :] == np.arange(num_players)[None, :, None]
+    scores, hits = config["rules"].score_many(owned)
+
+    # 勝者（同点は山分け）
+    best = scores.max(axis=1, keepdims=True)
+    winners = scores == best
+    seat_wins = (winners / winners.sum(axis=1, keepdims=True)).sum(axis=0)
+
+    return {
+        "games": num_games,
+        "score_hist": np.bincount(scores.ravel(), minlength=config["max_score"] + 1),
+        "rule_hits": hits.sum(axis=(0, 1)),
+        "seat_wins": seat_wins,
+        "seat_scores": scores.sum(axis=0),
+        "round_hist": np.bincount(rounds, minlength=config["max_rounds"] + 1),
+    }
+
+# ==========================================
+# 集計
+# ==========================================
+def _hist_percentiles(hist, qs):
+    cum = np.cumsum(hist)
+    total = cum[-1]
+    return {f"p{q}": int(np.searchsorted(cum, total * q / 100.0)) for q in qs}
+
+def hist_summary(hist):
+    values = np.arange(len(hist))
+    total = hist.sum()
+    mean = float((values * hist).sum() / total)
+    std = float(np.sqrt(((values - mean) ** 2 * hist).sum() / total))
+    summary = {"mean": round(mean, 3), "std": round(std, 3)}
+    summary.update(_hist_percentiles(hist, (5, 25, 50, 75, 95)))
+    summary["max"] = int(np.flatnonzero(hist).max())
+    return summary
+
+def simulate(num_games, num_players, stations, rules=BONUS_RULES, deck=EVENT_DECK_DATA,
+             seed=0, workers=None, p_correct=0.6, board_length=BOARD_LENGTH,
+             square_weights=SQUARE_WEIGHTS, max_rounds=MAX_ROUNDS, chunk_size=CHUNK_SIZE):
+    compiled = CompiledRules(stations, rules)
+    config = {
+        "rules": compiled, "deck": deck,
+        "square_weights": dict(square_weights), "p_correct": p_correct,
+        "board_length": board_length, "max_rounds": max_rounds, "route": compile_board(stations),
+        "max_score": len(stations) + sum(compiled.points),
+    }
+
+    # チャンクごとに独立した乱数列（ワーカー数を変えても結果は同じ）
+    sizes = [chunk_size] * (num_games // chunk_size)
+    if num_games % chunk_size:
+        sizes.append(num_games % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(n, num_players, len(stations), s, config) for n, s in zip(sizes, seeds)]
+
+    if workers == 1 or len(jobs) == 1:
+        parts = [simulate_chunk(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(simulate_chunk, *zip(*jobs)))
+
+    total = {key: sum(part[key] for part in parts) for key in parts[0]}
+    player_games = total["games"] * num_players
+    return {
+        "games": int(total["games"]),
+        "players": num_players,
+        "seed": seed,
+        "score": hist_summary(total["score_hist"]),
+        "score_hist": {int(v): int(c) for v, c in enumerate(total["score_hist"]) if c},
+        "rule_hit_rate": {rule["name"]: round(float(h) / player_games, 4)
+                          for rule, h in zip(rules, total["rule_hits"])},
+        "seat_win_rate": [round(float(w) / total["games"], 4) for w in total["seat_wins"]],
+        "seat_mean_score": [round(float(s) / total["games"], 3) for s in total["seat_scores"]],
+        "rounds": hist_summary(total["round_hist"]),
+    }
+
+def print_report(report):
+    print(f"🎲 {report['games']:,} ゲーム / {report['players']} 人 (seed={report['seed']})")
+    s = report["score"]
+    print(f"得点: 平均 {s['mean']} (標準偏差 {s['std']}) / 中央値 {s['p50']} / 5%〜95%: {s['p5']}〜{s['p95']} / 最高 {s['max']}")
+    r = report["rounds"]
+    print(f"ゲームの長さ: 平均 {r['mean']} ラウンド / 中央値 {r['p50']} / 95%: {r['p95']}")
+    print("ボーナス達成率（プレイヤー1人あたり）:")
+    for name, rate in report["rule_hit_rate"].items():
+        print(f"  {name}: {rate * 100:.2f}%")
+    print("席順ごとの勝率 / 平均得点:")
+    for seat, (rate, mean) in enumerate(zip(report["seat_win_rate"], report["seat_mean_score"]), 1):
+        print(f"  {seat}番目: {rate * 100:.2f}% / {mean}点")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="新幹線すごろくのモンテカルロ・シミュレーション")
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--p-correct", type=float, default=0.6, help="クイズの正解率")
+    parser.add_argument("--board-length", type=int, default=BOARD_LENGTH)
+    parser.add_argument("--data", default=quiz_store.DEFAULT_PATH, help="駅一覧を読むクイズデータ（CSV またはパック）")
+    parser.add_argument("--rules", help="BONUS_RULES の代わりに使うルール（JSON）")
+    parser.add_argument("--json", help="結果をJSONで保存するファイル")
+    args = parser.parse_args(argv)
+
+    rules = BONUS_RULES
+    if args.rules:
+        with open(args.rules, encoding="utf-8") as f:
+            rules = json.load(f)
+
+    report = simulate(args.games, args.players, load_stations(args.data), rules=rules,
+                      seed=args.seed, workers=args.workers, p_correct=args.p_correct,
+                      board_length=args.board_length)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    sys.exit(main())
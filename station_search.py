@@ -0,0 +1,136 @@
+# ==========================================
+# 駅名の検索（スタンプやクイズの駅選び用）
+# 駅名・よみがな・ローマ字のどれで入力しても駅を絞り込めるように、
+# 駅ごとの検索キーから 2文字ずつの索引（n-gram）を最初に1回だけ作っておく。
+# 入力のたびに全駅を調べ直さず、索引の共通部分から候補を出す
+# （よみがなは station_readings.csv。載っていない駅は駅名だけで探す）
+# ==========================================
+import csv
+import functools
+import os
+import unicodedata
+
+READINGS_PATH = os.environ.get("SUGOROKU_READINGS", "station_readings.csv")
+
+# ==========================================
+# かな → ローマ字（ヘボン式）
+# ==========================================
+_ROWS = {
+    "": "あいうえお", "k": "かきくけこ", "g": "がぎぐげご", "s": "さしすせそ", "z": "ざじずぜぞ",
+    "t": "たちつてと", "d": "だぢづでど", "n": "なにぬねの", "h": "はひふへほ", "b": "ばびぶべぼ",
+    "p": "ぱぴぷぺぽ", "m": "まみむめも", "r": "らりるれろ",
+}
+ROMAJI = {kana: consonant + vowel for consonant, row in _ROWS.items() for kana, vowel in zip(row, "aiueo")}
+ROMAJI.update({
+    "し": "shi", "じ": "ji", "ち": "chi", "つ": "tsu", "ぢ": "ji", "づ": "zu", "ふ": "fu",
+    "や": "ya", "ゆ": "yu", "よ": "yo", "わ": "wa", "を": "o", "ん": "n",
+    "ぁ": "a", "ぃ": "i", "ぅ": "u", "ぇ": "e", "ぉ": "o",
+})
+# きゃ・しゅ・ちょ など
+for _kana in "きしちにひみりぎじぢびぴ":
+    _head = ROMAJI[_kana][:-1] if ROMAJI[_kana] in ("shi", "chi", "ji") else ROMAJI[_kana][:-1] + "y"
+    for _small, _vowel in zip("ゃゅょ", "auo"):
+        ROMAJI[_kana + _small] = _head + _vowel
+
+def to_hiragana(text):
+    # カタカナをひらがなにする
+    return "".join(chr(ord(c) - 0x60) if "ァ" <= c <= "ヶ" else c for c in text)
+
+def to_romaji(kana):
+    result = []
+    double = False
+    i = 0
+    while i < len(kana):
+        if kana[i] == "っ":
+            double = True
+            i += 1
+            continue
+        pair = kana[i:i + 2]
+        roman = ROMAJI.get(pair) if len(pair) == 2 else None
+        if roman is None:
+            roman = ROMAJI.get(kana[i], kana[i])
+            i += 1
+        else:
+            i += 2
+        if double:
+            roman = ("t" if roman.startswith("ch") else roman[0]) + roman
+            double = False
+        result.append(roman)
+    return "".join(result)
+
+def shorten_long_vowels(romaji):
+    # とうきょう → tokyo のように伸ばす音を省いた書き方も探せるようにする
+    for long, short in (("ou", "o"), ("oo", "o"), ("uu", "u")):
+        romaji = romaji.replace(long, short)
+    return romaji
+
+def normalize(text):
+    # 全角・半角や大文字・小文字、カタカナ・ひらがなの違いをなくす
+    return to_hiragana(unicodedata.normalize("NFKC", text)).lower().replace(" ", "")
+
+def load_readings(path=READINGS_PATH):
+    try:
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            return {row["駅名"]: row["よみ"] for row in csv.DictReader(f)}
+    except FileNotFoundError:
+        return {}
+
+# ==========================================
+# 索引
+# ==========================================
+class StationIndex:
+    def __init__(self, stations, readings):
+        self.stations = tuple(stations)
+        self.readings = {s: readings[s] for s in self.stations if s in readings}
+        self.position = {s: i for i, s in enumerate(self.stations)}
+        self.keys = []      # 駅番号 -> 検索キー
+        self.grams = {}     # 1文字・2文字 -> その文字を含む駅番号の集合
+        for i, station in enumerate(self.stations):
+            keys = {normalize(station)}
+            reading = self.readings.get(station)
+            if reading:
+                kana = normalize(reading)
+                romaji = to_romaji(kana)
+                keys.update((kana, romaji, shorten_long_vowels(romaji)))
+            self.keys.append(tuple(keys))
+            for key in keys:
+                for n in (1, 2):
+                    for j in range(len(key) - n + 1):
+                        self.grams.setdefault(key[j:j + n], set()).add(i)
+
+    def label(self, station):
+        # 選択肢の表示用（よみがな付き）
+        reading = self.readings.get(station)
+        return f"{station}（{reading}）" if reading else station
+
+    def search(self, query, among=None):
+        # query を含む駅を、前方一致を先にして元の順で返す（among で候補を絞れる）
+        query = normalize(query)
+        candidates = self.stations if among is None else among
+        if not query:
+            return list(candidates)
+        grams = [query] if len(query) == 1 else [query[j:j + 2] for j in range(len(query) - 1)]
+        hits = None
+        for gram in grams:
+            ids = self.grams.get(gram)
+            if not ids:
+                return []
+            hits = set(ids) if hits is None else hits & ids
+        # 全駅から探すときは当たった駅だけを元の順に見る（候補が絞られているときはその中だけ）
+        if among is None or among is self.stations:
+            found = ((self.stations[i], i) for i in sorted(hits))
+        else:
+            found = ((s, self.position.get(s)) for s in candidates if self.position.get(s) in hits)
+        prefix, inside = [], []
+        for station, i in found:
+            keys = self.keys[i]
+            if any(k.startswith(query) for k in keys):
+                prefix.append(station)
+            elif any(query in k for k in keys):
+                inside.append(station)
+        return prefix + inside
+
+@functools.lru_cache(maxsize=8)
+def get_index(stations, path=READINGS_PATH):
+    # 駅の並びごとに1回だけ作って全セッションで共有する
+    return StationIndex(stations, load_readings(path))
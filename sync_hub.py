@@ -0,0 +1,529 @@
+# ==========================================
+# ほかの端末へのリアルタイム同期（ライブ中継）
+# ゲームの状態が変わるたびに「前と変わったところだけ」（スタンプの持ち主・ターン・
+# サイコロの目・位置・点数など）を小さなJSONにして、同じルームを見ている全員に送る。
+# 見ている側のページ（viewer_html）はそれを受け取って画面の該当部分だけを書き換えるので、
+# Streamlit のスクリプトを再実行したり、定期的に問い合わせたりしなくても最新の状態になる。
+#
+# 送信は asyncio のハブ（Hub）が Server-Sent Events（EventSource）で行う。
+# 1回の変化は1度だけ文字列にしておき、視聴者にはそのバイト列を書き込むだけなので、
+# 視聴者が増えても1人あたりの処理はソケットへの書き込み1回分で済む。
+# 読むのが遅れている視聴者は切断し、再接続したときに全体を送り直す。
+# 終わったルームは見ている人がいなくなったら、それ以外のルームも見ている人がいないまま
+# ROOM_IDLE_SECONDS 変化がなければ、ハブからもアプリ側の前回の状態からも消す。
+#
+# 環境変数 SUGOROKU_SYNC を指定したときだけ有効になる:
+#   SUGOROKU_SYNC=8765                   → アプリのプロセスの中でハブを動かす（0.0.0.0:8765）
+#   SUGOROKU_SYNC=http://127.0.0.1:8765  → 別に起動したハブへ送る（アプリを複数プロセスで動かす場合）
+#   SUGOROKU_SYNC_URL=http://192.168.0.10:8765 → 端末のブラウザからハブに届くURL（省略時は localhost）
+#
+# ハブだけを起動する:
+#   python sync_hub.py --port 8765
+# ==========================================
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+
+import metrics
+from game_store import ROOM_ALPHABET
+
+ADDRESS = os.environ.get("SUGOROKU_SYNC", "")
+PUBLIC_URL = os.environ.get("SUGOROKU_SYNC_URL", "")
+ENABLED = bool(ADDRESS)
+DEFAULT_PORT = 8765
+WRITE_BUFFER_LIMIT = 256 * 1024   # 送りきれていないデータがこれを超えた視聴者は切断する
+KEEPALIVE_SECONDS = 15            # 何も起きなくてもこの間隔でコメント行を送り、接続を保つ
+MAX_BODY = 64 * 1024              # 外部からの変化の受け付けサイズの上限
+ROOM_IDLE_SECONDS = 30 * 60       # 変化も視聴者もないルームを覚えておく時間
+DICT_FIELDS = ("pos", "scores", "stamps")
+
+# ==========================================
+# 状態と差分
+# ==========================================
+def view_of(game):
+    # 中継する状態（スタンプは持ち主ごとのビットマスクのまま持っておく）
+    return {
+        "players": tuple(game.players),
+        "turn": game.current_player,
+        "dice": game.dice_result,
+        "pos": dict(game.positions),
+        "done": tuple(game.finished_players),
+        "ended": game.game_ended,
+        "scores": game.scores.totals(),
+        "masks": {p: game.stamps.mask_of(p) for p in game.players},
+    }
+
+def full_patch(view, stations, seq):
+    # 最初に送る・送り直すときの全体（"full" が付いていたら受け取った側は状態を置き換える）
+    patch = {key: list(value) if isinstance(value, tuple) else value
+             for key, value in view.items() if key != "masks"}
+    patch["stamps"] = {}
+    for player, mask in view["masks"].items():
+        for i in range(len(stations)):
+            if mask >> i & 1:
+                patch["stamps"][stations[i]] = player
+    patch["seq"] = seq
+    patch["full"] = 1
+    return patch
+
+def diff(old, new, stations, seq):
+    # old から new で変わったところだけ（何も変わっていなければ None）。
+    # スタンプは持ち主のビットマスクの差から、変わった駅 → 新しい持ち主（いなければ null）
+    patch = {}
+    for key in ("players", "turn", "dice", "done", "ended"):
+        if old[key] != new[key]:
+            value = new[key]
+            patch[key] = list(value) if isinstance(value, tuple) else value
+    for key in ("pos", "scores"):
+        changed = {p: v for p, v in new[key].items() if old[key].get(p) != v}
+        if changed:
+            patch[key] = changed
+    changed = 0
+    for player in set(old["masks"]) | set(new["masks"]):
+        changed |= old["masks"].get(player, 0) ^ new["masks"].get(player, 0)
+    if changed:
+        stamps = {}
+        while changed:
+            low = changed & -changed
+            owner = next((p for p, mask in new["masks"].items() if mask & low), None)
+            stamps[stations[low.bit_length() - 1]] = owner
+            changed ^= low
+        patch["stamps"] = stamps
+    if not patch:
+        return None
+    patch["seq"] = seq
+    return patch
+
+def apply_patch(state, patch):
+    # ハブ側で持っておくルームの最新状態に差分を当てる
+    if patch.get("full"):
+        state.clear()
+    for key, value in patch.items():
+        if key == "full":
+            continue
+        if key in DICT_FIELDS and key in state:
+            for k, v in value.items():
+                if v is None:
+                    state[key].pop(k, None)
+                else:
+                    state[key][k] = v
+        elif key in DICT_FIELDS:
+            state[key] = {k: v for k, v in value.items() if v is not None}
+        else:
+            state[key] = value
+    return state
+
+def _event(patch, event_id=None):
+    # SSE の1件分（1回だけ作って全員に同じバイト列を送る）
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}data: {json.dumps(patch, ensure_ascii=False, separators=(',', ':'))}\n\n".encode("utf-8")
+
+# ==========================================
+# ハブ（asyncio）
+# ==========================================
+class Room:
+    __slots__ = ("state", "viewers", "touched")
+
+    def __init__(self):
+        self.state = {}
+        self.viewers = set()   # asyncio.StreamWriter
+        self.touched = time.monotonic()
+
+class Hub:
+    # 1つのイベントループの中だけで動かす。ほかのスレッドからは publish_threadsafe を使う
+    def __init__(self):
+        self.rooms = {}
+        self.loop = None
+        self.server = None
+        self.sent = 0
+        self.dropped = 0
+
+    # --- 送信 ---
+    def publish(self, room, patch):
+        entry = self.rooms.get(room)
+        if entry is None:
+            entry = self.rooms[room] = Room()
+        apply_patch(entry.state, patch)
+        entry.touched = time.monotonic()
+        if entry.viewers:
+            self._fan_out(entry, _event(patch, patch.get("seq")))
+
+    def publish_threadsafe(self, room, patch):
+        self.loop.call_soon_threadsafe(self.publish, room, patch)
+
+    def _fan_out(self, entry, payload):
+        for writer in list(entry.viewers):
+            if writer.is_closing():
+                entry.viewers.discard(writer)
+                continue
+            writer.write(payload)
+            self.sent += 1
+            if writer.transport.get_write_buffer_size() > WRITE_BUFFER_LIMIT:
+                # 読み遅れている。切断して、再接続のときに全体を送り直す
+                self.dropped += 1
+                entry.viewers.discard(writer)
+                writer.close()
+
+    def prune(self, now=None):
+        # 見ている人がいないルームのうち、終わったものと長く変化のないものを消す
+        now = time.monotonic() if now is None else now
+        for room, entry in list(self.rooms.items()):
+            if not entry.viewers and (entry.state.get("ended") or now - entry.touched > ROOM_IDLE_SECONDS):
+                del self.rooms[room]
+
+    def viewer_count(self, room=None):
+        if room is not None:
+            entry = self.rooms.get(room)
+            return len(entry.viewers) if entry else 0
+        return sum(len(entry.viewers) for entry in self.rooms.values())
+
+    # --- HTTP ---
+    async def handle(self, reader, writer):
+        # アプリからの送信は1本の接続を使い回すので、keep-alive の間は次のリクエストを読む
+        try:
+            while await self._request(reader, writer):
+                pass
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def _request(self, reader, writer):
+        # 1リクエスト分を処理して、同じ接続で続けるなら True
+        try:
+            request = await reader.readline()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            method, target, _ = request.decode("latin-1").split(" ", 2)
+        except ValueError:
+            return False
+        parts = urllib.parse.urlsplit(target).path.strip("/").split("/")
+        if len(parts) < 2 or parts[0] != "rooms":
+            return await self._respond(writer, 404, b"not found")
+        room = parts[1].upper()
+        if not room or any(c not in ROOM_ALPHABET for c in room):
+            # ルームコードはページの中にそのまま埋め込むので、使える文字だけのものしか受け付けない
+            return await self._respond(writer, 404, b"not found")
+
+        if method == "GET" and parts[2:] == ["events"]:
+            return await self._stream(room, reader, writer)
+        if method == "GET" and len(parts) == 2:
+            return await self._respond(writer, 200, viewer_html(room, "").encode("utf-8"), "text/html; charset=utf-8")
+        if method == "POST" and len(parts) == 2:
+            # 変化を送ってよいのは同じマシンのアプリだけ
+            host = (writer.get_extra_info("peername") or ("",))[0]
+            if host not in ("127.0.0.1", "::1"):
+                return await self._respond(writer, 403, b"forbidden")
+            try:
+                length = int(headers.get("content-length", "0"))
+            except ValueError:
+                return await self._respond(writer, 400, b"bad request")
+            if not 0 < length <= MAX_BODY:
+                return await self._respond(writer, 413, b"too large")
+            try:
+                patch = json.loads(await reader.readexactly(length))
+            except (ValueError, asyncio.IncompleteReadError):
+                return await self._respond(writer, 400, b"bad request")
+            self.publish(room, patch)
+            return await self._respond(writer, 204, b"", keep_alive=True)
+        return await self._respond(writer, 404, b"not found")
+
+    async def _respond(self, writer, status, body, content_type="text/plain", keep_alive=False):
+        reason = {200: "OK", 204: "No Content", 400: "Bad Request", 403: "Forbidden",
+                  404: "Not Found", 413: "Payload Too Large"}[status]
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+            f"Access-Control-Allow-Origin: *\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+            .encode("latin-1") + body)
+        await writer.drain()
+        return keep_alive
+
+    async def _stream(self, room, reader, writer):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                     b"Access-Control-Allow-Origin: *\r\nConnection: keep-alive\r\n\r\n"
+                     b"retry: 2000\n\n")
+        entry = self.rooms.get(room)
+        if entry is None:
+            entry = self.rooms[room] = Room()
+        if entry.state:
+            writer.write(_event(dict(entry.state, full=1), entry.state.get("seq")))
+        entry.viewers.add(writer)
+        metrics.gauge("sync_viewers", self.viewer_count())
+        try:
+            # 視聴者からは何も来ない。切断されるまで待つ
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            entry.viewers.discard(writer)
+            entry.touched = time.monotonic()
+            if not entry.viewers and entry.state.get("ended") and self.rooms.get(room) is entry:
+                del self.rooms[room]
+            metrics.gauge("sync_viewers", self.viewer_count())
+        return False
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(KEEPALIVE_SECONDS)
+            self.prune()
+            for entry in self.rooms.values():
+                if entry.viewers:
+                    self._fan_out(entry, b": keepalive\n\n")
+
+    async def serve(self, host="0.0.0.0", port=DEFAULT_PORT, ready=None):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self.handle, host, port)
+        keepalive = asyncio.create_task(self._keepalive())
+        if ready is not None:
+            ready.set()
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            keepalive.cancel()
+
+def start_hub(host="0.0.0.0", port=DEFAULT_PORT):
+    # 別スレッドのイベントループでハブを動かして返す
+    hub = Hub()
+    ready = threading.Event()
+    thread = threading.Thread(target=asyncio.run, args=(hub.serve(host, port, ready),),
+                              name="sugoroku-sync", daemon=True)
+    thread.start()
+    if not ready.wait(5):
+        raise RuntimeError(f"同期用のハブを {host}:{port} で起動できませんでした")
+    return hub
+
+# ==========================================
+# アプリ側: ストアの変化を差分にして送る
+# ==========================================
+class Publisher:
+    # GameStore.listen に渡す。ルームごとに前回送った状態を覚えておき、差分だけを send に渡す。
+    # 終わったルームと ROOM_IDLE_SECONDS 変化のないルームは忘れる（次に変化があれば全体を送る）
+    def __init__(self, send, idle_seconds=ROOM_IDLE_SECONDS):
+        self._send = send
+        self._views = OrderedDict()   # room -> (前回送った状態, 送った時刻)
+        self._lock = threading.Lock()
+        self.idle_seconds = idle_seconds
+
+    def __call__(self, room, game):
+        view = view_of(game)
+        now = time.monotonic()
+        with self._lock:
+            old = self._views.pop(room, (None,))[0]
+            if not view["ended"]:
+                self._views[room] = (view, now)
+            while self._views:
+                oldest, (_, touched) = next(iter(self._views.items()))
+                if now - touched <= self.idle_seconds:
+                    break
+                del self._views[oldest]
+        stations = game.stamps.stations
+        patch = full_patch(view, stations, game.seq) if old is None else diff(old, view, stations, game.seq)
+        if patch is not None:
+            self._send(room, patch)
+
+    def ensure(self, room, game):
+        # まだ何も送っていないルームなら今の状態を全体で送る（アプリを起動し直した直後など）
+        with self._lock:
+            if room in self._views:
+                return
+        self(room, game)
+
+    def forget(self, room=None):
+        # 次の変化で全体を送り直す
+        with self._lock:
+            if room is None:
+                self._views.clear()
+            else:
+                self._views.pop(room, None)
+
+class RemoteSender:
+    # 別プロセスのハブへ HTTP で送る。送信は専用のスレッドで行い、ゲームの操作は待たせない
+    def __init__(self, url):
+        self.url = urllib.parse.urlsplit(url)
+        self.publisher = None
+        self._queue = queue.Queue(maxsize=10000)
+        self._conn = None
+        threading.Thread(target=self._run, name="sugoroku-sync-sender", daemon=True).start()
+
+    def __call__(self, room, patch):
+        try:
+            self._queue.put_nowait((room, patch))
+        except queue.Full:
+            if self.publisher is not None:
+                self.publisher.forget(room)
+
+    def _run(self):
+        while True:
+            room, patch = self._queue.get()
+            body = json.dumps(patch, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            try:
+                if self._conn is None:
+                    self._conn = http.client.HTTPConnection(self.url.hostname, self.url.port or DEFAULT_PORT, timeout=5)
+                self._conn.request("POST", f"/rooms/{room}", body, {"Content-Type": "application/json"})
+                self._conn.getresponse().read()
+            except (OSError, http.client.HTTPException):
+                # ハブが落ちていた。つながり直したら全体から送る
+                self._conn = None
+                if self.publisher is not None:
+                    self.publisher.forget(room)
+
+_attached = {}
+_attach_lock = threading.Lock()
+
+def attach(store, address=ADDRESS):
+    # store の変化をハブへ流す（プロセスにつき1回。2回目以降は同じものを返す）
+    with _attach_lock:
+        publisher = _attached.get(id(store))
+        if publisher is not None:
+            return publisher
+        if address.startswith(("http://", "https://")):
+            sender = RemoteSender(address)
+            publisher = sender.publisher = Publisher(sender)
+        else:
+            host, _, port = address.rpartition(":")
+            hub = start_hub(host or "0.0.0.0", int(port))
+            publisher = Publisher(hub.publish_threadsafe)
+        store.listen(publisher)
+        _attached[id(store)] = publisher
+        return publisher
+
+def public_url(address=ADDRESS):
+    # 端末のブラウザから見たハブのURL
+    if PUBLIC_URL:
+        return PUBLIC_URL.rstrip("/")
+    if address.startswith(("http://", "https://")):
+        return address.rstrip("/")
+    return f"http://localhost:{address.rpartition(':')[2]}"
+
+def room_url(room, address=ADDRESS):
+    return f"{public_url(address)}/rooms/{room}"
+
+# ==========================================
+# 見ている側のページ
+# ==========================================
+VIEWER_TEMPLATE = """<!doctype html>
+<html><head><meta charset="utf-8"><meta name="viewport" content="width=device-width,initial-scale=1">
+<style>
+body { font-family: sans-serif; margin: 0; padding: 8px; color: #262730; }
+#status { font-size: 12px; color: #888; }
+#turn { font-size: 22px; font-weight: bold; margin: 4px 0; }
+#dice { font-size: 16px; margin-bottom: 6px; }
+table { border-collapse: collapse; width: 100%; font-size: 15px; }
+td { padding: 4px 6px; border-bottom: 1px solid #eee; }
+tr.now { background: #fff3cd; }
+tr.done td:first-child::after { content: " 🎉"; }
+#feed { font-size: 13px; color: #555; margin-top: 6px; }
+.flash { animation: flash 1.5s; }
+@keyframes flash { from { background: #ffe08a; } to { background: transparent; } }
+</style></head>
+<body>
+<div id="status">📡 接続中...</div>
+<div id="turn"></div>
+<div id="dice"></div>
+<table id="players"></table>
+<div id="feed"></div>
+<script>
+const source = new EventSource("__EVENTS__");
+const state = {pos: {}, scores: {}, stamps: {}};
+const rows = {};
+const $ = (id) => document.getElementById(id);
+
+function row(player) {
+  if (!rows[player]) {
+    const tr = document.createElement("tr");
+    tr.innerHTML = "<td></td><td></td><td></td><td></td>";
+    tr.cells[0].textContent = player;
+    $("players").appendChild(tr);
+    rows[player] = tr;
+  }
+  return rows[player];
+}
+function flash(el) { el.classList.remove("flash"); void el.offsetWidth; el.classList.add("flash"); }
+function counts() {
+  const c = {};
+  for (const owner of Object.values(state.stamps)) c[owner] = (c[owner] || 0) + 1;
+  return c;
+}
+function feed(text) {
+  const div = document.createElement("div");
+  div.textContent = text;
+  $("feed").prepend(div);
+  while ($("feed").childNodes.length > 5) $("feed").lastChild.remove();
+}
+
+source.onopen = () => { $("status").textContent = "📡 ライブ中継中"; };
+source.onerror = () => { $("status").textContent = "📡 再接続中..."; };
+source.onmessage = (message) => {
+  const patch = JSON.parse(message.data);
+  if (patch.full) {
+    state.pos = {}; state.scores = {}; state.stamps = {};
+    $("players").innerHTML = ""; for (const p in rows) delete rows[p];
+  }
+  for (const key of ["pos", "scores", "stamps"]) {
+    for (const [k, v] of Object.entries(patch[key] || {})) {
+      if (v === null) delete state[key][k]; else state[key][k] = v;
+      if (key === "stamps" && !patch.full) feed(v === null ? `${k} のスタンプが戻された` : `${v} さんが ${k} のスタンプをゲット！`);
+    }
+  }
+  for (const key of ["players", "turn", "dice", "done", "ended", "seq"]) {
+    if (key in patch) state[key] = patch[key];
+  }
+  // 変わったところだけ書き換える
+  if ("turn" in patch || "ended" in patch) {
+    $("turn").textContent = state.ended ? "🏁 ゲーム終了" : `🚄 ${state.turn} さんのターン`;
+    flash($("turn"));
+  }
+  if ("dice" in patch) {
+    $("dice").textContent = state.dice ? `🎲 ${state.dice}` : "";
+    if (state.dice) flash($("dice"));
+  }
+  const c = counts();
+  for (const player of state.players || []) {
+    const tr = row(player);
+    tr.className = (player === state.turn ? "now " : "") + ((state.done || []).includes(player) ? "done" : "");
+    const cells = [state.pos[player] || "", `${c[player] || 0}枚`, `${state.scores[player] || 0}点`];
+    cells.forEach((text, i) => {
+      if (tr.cells[i + 1].textContent !== text) { tr.cells[i + 1].textContent = text; flash(tr.cells[i + 1]); }
+    });
+  }
+};
+</script>
+</body></html>
+"""
+
+def viewer_html(room, base_url=None):
+    # ルームのライブ中継ページ（base_url を空にするとハブと同じ場所から読む）
+    base = public_url() if base_url is None else base_url
+    return VIEWER_TEMPLATE.replace("__EVENTS__", f"{base}/rooms/{room}/events")
+
+# ==========================================
+# コマンドライン（ハブだけを起動する）
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="新幹線すごろくのリアルタイム同期ハブ")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args(argv)
+    print(f"📡 http://{args.host}:{args.port}/rooms/<ルームコード> で中継します")
+    try:
+        asyncio.run(Hub().serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())